@@ -0,0 +1,57 @@
+__author__ = 'samuelraker'
+
+import os
+import sys
+import time
+import subprocess
+
+
+###Measures how long it takes a fresh interpreter (e.g. a newly spawned worker) to import
+###the project's modules. The Twitter credential environment variables are set to dummy values,
+###so any import-time request to the API or credential check shows up in the timings.
+###Usage: python benchmarks/import_time.py [runs] [module ...]
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['get_tweets', 'tokenize_tweet', 'hash_index', 'hash_stats', 'dedup', 'geo_index']
+
+
+def time_import(statement, runs=20, env=None):
+	"""
+	Runs a statement in a fresh interpreter several times.
+	:param statement: the Python statement to run, e.g. "import get_tweets".
+	:type statement: string.
+	:param runs: how many interpreters to start.
+	:type runs: integer.
+	:param env: the environment to run the interpreters in.
+	:type env: dictionary.
+	:return: list of floats, the wall-clock time (in milliseconds) of each run.
+	"""
+	times = []
+	with open(os.devnull, 'w') as devnull:
+		for _ in xrange(runs):
+			start = time.time()
+			subprocess.check_call([sys.executable, '-c', statement], cwd=ROOT, env=env, stdout=devnull)
+			times.append((time.time() - start) * 1000)
+	return times
+
+
+def median(l):
+	l = sorted(l)
+	return l[len(l) // 2]
+
+
+def main(runs=20, modules=None):
+	env = dict(os.environ)
+	for var in ("TWITTER_TOKEN", "TWITTER_TOKEN_SECRET", "TWITTER_CONSUMER_KEY", "TWITTER_CONSUMER_SECRET"):
+		env[var] = 'benchmark'
+	env['PYTHONDONTWRITEBYTECODE'] = '1'
+	baseline = median(time_import('pass', runs, env))
+	print "{0:<16} {1:>10.1f} ms".format('(interpreter)', baseline)
+	for module in modules or MODULES:
+		t = median(time_import('import {}'.format(module), runs, env))
+		print "{0:<16} {1:>10.1f} ms  (+{2:.1f} ms)".format(module, t, t - baseline)
+
+
+if __name__ == "__main__":
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 20, sys.argv[2:])
@@ -0,0 +1,315 @@
+__author__ = 'samuelraker'
+
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic import generate, write_jsonl
+
+
+###End-to-end benchmarks of the pipeline's hot paths, run against synthetic tweets.
+###Each benchmark runs in its own process, so peak RSS is per benchmark. Results can be saved as a
+###baseline, and later runs compared against it.
+###Usage: python benchmarks/run.py [--scale N] [--only NAME ...] [--save-baseline] [--compare]
+###NB: the serialize and database benchmarks need Django, and the hash_to_hash app (or the stand-in
+###in tests/); the database ones use a throwaway SQLite database. Benchmarks whose dependencies are
+###missing are skipped.
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+BENCHMARKS = []
+TESTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+
+
+class Skip(Exception):
+	pass
+
+
+def benchmark(name, scale=1.0):
+	"""
+	A decorator that registers a benchmark. A benchmark takes the number of tweets to use and a
+	scratch directory, does any setup, and returns a function to be timed along with the number of
+	tweets that function will process.
+	:param name: the name of the benchmark.
+	:type name: string.
+	:param scale: the fraction of --scale tweets to use, for benchmarks that are superlinear.
+	:type scale: float.
+	"""
+	def register(func):
+		BENCHMARKS.append((name, scale, func))
+		return func
+	return register
+
+
+def parsed_tweets(n):
+	from get_tweets import ParsedTweet
+	return [ParsedTweet(tweet['text'], tweet) for tweet in generate(n)]
+
+
+def setup_django(workdir):
+	"""
+	Points Django at a fresh SQLite database in workdir and creates the hash_to_hash tables.
+	NB: if the real hash_to_hash app isn't importable, the stand-in in tests/ is used.
+	"""
+	try:
+		import django
+		from django.conf import settings
+		from django.core.management import call_command
+	except ImportError:
+		raise Skip("django is not installed")
+	if not settings.configured:
+		settings.configure(
+			DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+			                       'NAME': os.path.join(workdir, 'bench.sqlite3')}},
+			INSTALLED_APPS=['hash_to_hash'])
+	sys.path.append(TESTS)
+	try:
+		if hasattr(django, 'setup'):
+			django.setup()
+		import get_tweets
+		get_tweets.load_django()
+	except ImportError:
+		raise Skip("the hash_to_hash app is not importable")
+	try:
+		call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+	except Exception:
+		call_command('syncdb', interactive=False, verbosity=0)
+
+
+@benchmark('parsed_tweet')
+def bench_parsed_tweet(n, workdir):
+	from get_tweets import ParsedTweet
+	tweets = list(generate(n))
+
+	def run():
+		for tweet in tweets:
+			ParsedTweet(tweet['text'], tweet)
+	return run, n
+
+
+@benchmark('unifilter')
+def bench_unifilter(n, workdir):
+	from get_tweets import unifilter
+	texts = [tweet['text'].encode('utf8') for tweet in generate(n)]
+
+	def run():
+		for text in texts:
+			unifilter(text)
+	return run, n
+
+
+@benchmark('infer_spaces', 0.2)
+def bench_infer_spaces(n, workdir):
+	try:
+		from tokenize_hash import infer_spaces
+	except IOError:
+		raise Skip("tokenize_hash needs words-by-frequency.txt")
+	tags = [ht['text'].lower() for tweet in generate(n) for ht in tweet['entities']['hashtags']][:n]
+
+	def run():
+		for tag in tags:
+			infer_spaces(tag)
+	return run, len(tags)
+
+
+@benchmark('to_json')
+def bench_to_json(n, workdir):
+	from get_tweets import to_json
+	tweets = parsed_tweets(n)
+	outfile = os.path.join(workdir, 'to_json.json')
+
+	def run():
+		to_json(tweets, outfile)
+	return run, n
+
+
+@benchmark('json_to_parsed')
+def bench_json_to_parsed(n, workdir):
+	from get_tweets import json_to_parsed
+	infile = os.path.join(workdir, 'tweets.json')
+	write_jsonl(infile, n)
+
+	def run():
+		json_to_parsed(infile)
+	return run, n
+
+
+@benchmark('serialize_tweets')
+def bench_serialize_tweets(n, workdir):
+	setup_django(workdir)
+	from get_tweets import Twitterator
+	infile = os.path.join(workdir, 'tweets.json')
+	write_jsonl(infile, n)
+	t = Twitterator(infile, verbosity=False)
+	t.competitors = []
+
+	def run():
+		t.serialize_tweets()
+	return run, n
+
+
+@benchmark('serialize_competitors', 0.02)
+def bench_serialize_competitors(n, workdir):
+	setup_django(workdir)
+	from get_tweets import Twitterator
+	t = Twitterator(verbosity=False)
+	t.competitors = [ht['text'] for tweet in generate(n) for ht in tweet['entities']['hashtags']]
+
+	def run():
+		t.serialize_competitors()
+	return run, n
+
+
+@benchmark('tweets_to_db', 0.2)
+def bench_tweets_to_db(n, workdir):
+	setup_django(workdir)
+	from get_tweets import Twitterator
+	infile = os.path.join(workdir, 'tweets.json')
+	write_jsonl(infile, n)
+	t = Twitterator(infile, verbosity=False)
+
+	def run():
+		t.tweets_to_db()
+	return run, n
+
+
+@benchmark('competitors_to_db', 0.01)
+def bench_competitors_to_db(n, workdir):
+	setup_django(workdir)
+	from get_tweets import Twitterator
+	infile = os.path.join(workdir, 'tweets.json')
+	write_jsonl(infile, n)
+	t = Twitterator(infile, verbosity=False)
+	t.tweets_to_db()
+
+	def run():
+		t.competitors_to_db()
+	return run, n
+
+
+def measure(func, n, results):
+	"""
+	Runs one benchmark (in a child process) and puts its results on a queue.
+	"""
+	workdir = tempfile.mkdtemp(prefix='hash_out_bench')
+	stdout = sys.stdout
+	try:
+		sys.stdout = open(os.devnull, 'w')
+		run, count = func(n, workdir)
+		gc.collect()
+		objects = len(gc.get_objects())
+		start = time.time()
+		run()
+		elapsed = time.time() - start
+		sys.stdout = stdout
+		results.put({
+			'tweets': count,
+			'seconds': elapsed,
+			'tweets_per_sec': count / elapsed if elapsed else float('inf'),
+			'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+			'new_objects': len(gc.get_objects()) - objects,
+		})
+	except Skip as e:
+		results.put({'skipped': str(e)})
+	except Exception as e:
+		results.put({'error': '{}: {}'.format(type(e).__name__, e)})
+	finally:
+		sys.stdout = stdout
+		shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_benchmarks(scale=10000, only=None):
+	"""
+	:param scale: the number of tweets each benchmark uses (before its own scale factor.)
+	:type scale: integer.
+	:param only: the names of the benchmarks to run. If None, all of them are run.
+	:type only: list of strings.
+	:return: dictionary of benchmark name: results.
+	"""
+	results = {}
+	for name, factor, func in BENCHMARKS:
+		if only and name not in only:
+			continue
+		queue = multiprocessing.Queue()
+		p = multiprocessing.Process(target=measure, args=(func, max(1, int(scale * factor)), queue))
+		p.start()
+		results[name] = queue.get()
+		p.join()
+	return results
+
+
+def compare(results, baseline, tolerance=0.1):
+	"""
+	:param results: the results of this run.
+	:type results: dictionary.
+	:param baseline: the saved results of an earlier run.
+	:type baseline: dictionary.
+	:param tolerance: how much slower (or bigger) a benchmark can get before it counts as a regression.
+	:type tolerance: float.
+	:return: list of strings describing each regression.
+	"""
+	regressions = []
+	for name, result in sorted(results.items()):
+		old = baseline.get(name)
+		if not old or 'tweets_per_sec' not in old or 'tweets_per_sec' not in result:
+			continue
+		if result['tweets_per_sec'] < old['tweets_per_sec'] * (1 - tolerance):
+			regressions.append("{}: {:.0f} tweets/sec, down from {:.0f}".format(
+				name, result['tweets_per_sec'], old['tweets_per_sec']))
+		if result['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+			regressions.append("{}: peak RSS {:.1f} MB, up from {:.1f} MB".format(
+				name, result['peak_rss_mb'], old['peak_rss_mb']))
+	return regressions
+
+
+def report(results):
+	print "{0:<24}{1:>8}{2:>14}{3:>10}{4:>12}{5:>14}".format(
+		'benchmark', 'tweets', 'tweets/sec', 'seconds', 'peak MB', 'new objects')
+	for name, factor, func in BENCHMARKS:
+		if name not in results:
+			continue
+		r = results[name]
+		if 'skipped' in r:
+			print "{0:<24}skipped: {1}".format(name, r['skipped'])
+		elif 'error' in r:
+			print "{0:<24}error: {1}".format(name, r['error'])
+		else:
+			print "{0:<24}{1:>8}{2:>14.0f}{3:>10.3f}{4:>12.1f}{5:>14}".format(
+				name, r['tweets'], r['tweets_per_sec'], r['seconds'], r['peak_rss_mb'], r['new_objects'])
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--scale', type=int, default=10000, help="tweets per benchmark")
+	parser.add_argument('--only', nargs='*', help="benchmarks to run")
+	parser.add_argument('--baseline', default=BASELINE, help="the baseline file")
+	parser.add_argument('--save-baseline', action='store_true', help="save the results as the new baseline")
+	parser.add_argument('--compare', action='store_true', help="compare the results against the baseline")
+	parser.add_argument('--tolerance', type=float, default=0.1, help="allowed slowdown before a regression")
+	args = parser.parse_args()
+	results = run_benchmarks(args.scale, args.only)
+	report(results)
+	status = 0
+	if args.compare:
+		with open(args.baseline) as f:
+			regressions = compare(results, json.load(f), args.tolerance)
+		for regression in regressions:
+			print "REGRESSION {}".format(regression)
+		status = 1 if regressions else 0
+	if args.save_baseline:
+		with open(args.baseline, 'w') as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+		print "baseline saved to {}".format(args.baseline)
+	return status
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,134 @@
+__author__ = 'samuelraker'
+
+import json
+import time
+import random
+
+
+###Generates synthetic tweets shaped like the ones the Streaming API returns, with nested user,
+###entities.hashtags, and (sometimes) coordinates, for benchmarking without a network connection.
+
+
+WORDS = ('the a to of and in is it you that for on my this with just be are so me at have not your '
+         'but all like was get what love can do up out if now no one know good day lol time new go '
+         'today game people great night see win vote team best free happy back follow music show').split()
+HASHTAG_WORDS = ('go team usa love music news win vote tbt ff fail epic best live game day night '
+                 'follow back happy summer time photo art life style food fun').split()
+TIME_ZONES = ['Eastern Time (US & Canada)', 'Pacific Time (US & Canada)', 'London', 'Central Time (US & Canada)',
+              'Quito', 'Amsterdam', None]
+
+
+def make_hashtags(rng, n=2000):
+	"""
+	:param rng: the random number generator to use.
+	:type rng: random.Random object.
+	:param n: how many distinct hashtags to make.
+	:type n: integer.
+	:return: list of strings, mixing camelCase and lowercase hashtags.
+	"""
+	tags = set()
+	while len(tags) < n:
+		words = rng.sample(HASHTAG_WORDS, rng.randint(1, 3))
+		if rng.random() < 0.5:
+			tags.add(''.join(w.capitalize() for w in words))
+		else:
+			tags.add(''.join(words))
+	return sorted(tags)
+
+
+def make_tweet(i, rng, hashtags, geo_fraction=0.1, retweet_fraction=0.1, start=1372000000):
+	"""
+	Makes one tweet dictionary.
+	:param i: the tweet's sequence number; ids and creation times increase with it.
+	:type i: integer.
+	:param rng: the random number generator to use.
+	:type rng: random.Random object.
+	:param hashtags: the hashtags to choose from. Popular ones are chosen more often (roughly Zipfian.)
+	:type hashtags: list of strings.
+	:param geo_fraction: the fraction of tweets that have coordinates.
+	:type geo_fraction: float.
+	:param retweet_fraction: the fraction of tweets that are retweets of earlier tweets.
+	:type retweet_fraction: float.
+	:param start: the creation time of the first tweet, in seconds since the epoch.
+	:type start: integer.
+	:return: dictionary.
+	"""
+	tid = 350000000000000000 + i * 1000 + rng.randint(0, 999)
+	created = start + i // 10
+	tags = [hashtags[min(len(hashtags) - 1, int(rng.paretovariate(1.2)) - 1)] for _ in xrange(rng.randint(1, 3))]
+	words = [rng.choice(WORDS) for _ in xrange(rng.randint(4, 16))]
+	if rng.random() < 0.3:
+		words.insert(0, '@user{}'.format(rng.randint(0, 10000)))
+	text = u' '.join(words + [u'#' + tag for tag in tags])
+	tweet = {
+		'id': tid,
+		'id_str': str(tid),
+		'text': text,
+		'lang': 'en',
+		'created_at': time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime(created)),
+		'timestamp_ms': str(created * 1000),
+		'source': 'web',
+		'retweet_count': 0,
+		'favorited': False,
+		'user': {
+			'id': rng.randint(1, 10 ** 9),
+			'screen_name': 'user{}'.format(rng.randint(0, 10000)),
+			'followers_count': rng.randint(0, 5000),
+			'lang': 'en',
+			'time_zone': rng.choice(TIME_ZONES),
+		},
+		'entities': {
+			'hashtags': [{'text': tag, 'indices': [0, len(tag) + 1]} for tag in tags],
+			'urls': [],
+			'user_mentions': [],
+		},
+		'coordinates': None,
+		'place': None,
+	}
+	if rng.random() < geo_fraction:
+		lon = rng.uniform(-125, -70) if rng.random() < 0.7 else rng.uniform(-180, 180)
+		lat = rng.uniform(25, 50) if rng.random() < 0.7 else rng.uniform(-60, 70)
+		tweet['coordinates'] = {'type': 'Point', 'coordinates': [lon, lat]}
+	if i and rng.random() < retweet_fraction:
+		original = start + rng.randint(0, i)
+		tweet['retweeted_status'] = {'id': 350000000000000000 + (original - start) * 1000}
+		tweet['text'] = u'RT @user{}: {}'.format(rng.randint(0, 10000), text)
+	return tweet
+
+
+def generate(n, seed=0, n_hashtags=2000, geo_fraction=0.1, retweet_fraction=0.1):
+	"""
+	A generator of synthetic tweets. The same seed always produces the same tweets.
+	:param n: how many tweets to generate.
+	:type n: integer.
+	:param seed: the random seed.
+	:type seed: integer.
+	:param n_hashtags: how many distinct hashtags to draw from.
+	:type n_hashtags: integer.
+	:param geo_fraction: see make_tweet.
+	:type geo_fraction: float.
+	:param retweet_fraction: see make_tweet.
+	:type retweet_fraction: float.
+	:return: dictionaries.
+	"""
+	rng = random.Random(seed)
+	hashtags = make_hashtags(rng, n_hashtags)
+	for i in xrange(n):
+		yield make_tweet(i, rng, hashtags, geo_fraction, retweet_fraction)
+
+
+def write_jsonl(outfile, n, seed=0, **kwargs):
+	"""
+	Writes synthetic tweets to a file in the format written by get_tweets.to_json, i.e. one
+	[text, metadata] list of JSON per line.
+	:param outfile: the name of the file to write.
+	:type outfile: string.
+	:param n: how many tweets to write.
+	:type n: integer.
+	:param seed: the random seed.
+	:type seed: integer.
+	"""
+	with open(outfile, 'w') as f:
+		for tweet in generate(n, seed, **kwargs):
+			f.write(json.dumps([tweet['text'], tweet]))
+			f.write('\n')
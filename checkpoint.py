@@ -0,0 +1,72 @@
+__author__ = 'samuelraker'
+
+import os
+import json
+
+
+###Durable progress records for long-running batch jobs (see Twitterator.tweets_to_db and
+###Twitterator.competitors_to_db), so that an interrupted load can pick up where it stopped.
+
+
+class Checkpoint(object):
+	def __init__(self, path):
+		"""
+		A JSON file holding the state of any number of jobs, each under its own name.
+		Every update rewrites the file atomically (write to a temporary file, fsync, rename), so a
+		crash leaves either the old state or the new one, never a mix.
+		:param path: the checkpoint file. It's created on the first update if it doesn't exist.
+		:type path: string.
+		"""
+		self.path = path
+		self.jobs = {}
+		if os.path.exists(path):
+			with open(path) as f:
+				self.jobs = json.load(f)
+
+	def get(self, job):
+		"""
+		:param job: the name of the job.
+		:type job: string.
+		:return: dictionary of the job's saved state (empty if it has none.)
+		"""
+		return dict(self.jobs.get(job, {}))
+
+	def update(self, job, **state):
+		"""
+		Merges new values into a job's state and saves it. A value of None removes that key.
+		:param job: the name of the job.
+		:type job: string.
+		:param state: the values to save.
+		"""
+		current = self.jobs.setdefault(job, {})
+		for k, v in state.items():
+			if v is None:
+				current.pop(k, None)
+			else:
+				current[k] = v
+		self.save()
+
+	def clear(self, job):
+		"""
+		Forgets a job's state, e.g. once it has finished.
+		"""
+		if self.jobs.pop(job, None) is not None:
+			self.save()
+
+	def save(self):
+		tmp = '{}.tmp'.format(self.path)
+		with open(tmp, 'w') as f:
+			json.dump(self.jobs, f, sort_keys=True)
+			f.flush()
+			os.fsync(f.fileno())
+		os.rename(tmp, self.path)
+
+
+def get_checkpoint(checkpoint):
+	"""
+	:param checkpoint: a Checkpoint object, the path to a checkpoint file, or None.
+	:return: Checkpoint object, or None.
+	"""
+	if isinstance(checkpoint, basestring):
+		return Checkpoint(checkpoint)
+	return checkpoint
@@ -0,0 +1,145 @@
+__author__ = 'samuelraker'
+
+import re
+from hash_index import tweet_id, tweet_timestamp
+from hash_stats import hash64
+
+
+###Drops retweets and duplicate tweets from a stream in fixed memory.
+
+
+class RotatingSet(object):
+	def __init__(self, window=86400, max_size=1000000):
+		"""
+		A set that forgets. Keys live in one of two generations; when the current generation
+		is half a window old, or holds half of max_size keys, the older generation is thrown away
+		and the current one takes its place. Every key is remembered for at least half a window
+		(unless the set fills up first), and at most max_size keys are ever held.
+		:param window: how long (in seconds) to remember keys for.
+		:type window: integer.
+		:param max_size: the maximum number of keys held.
+		:type max_size: integer.
+		"""
+		self.window = window
+		self.max_size = max_size
+		self.current = set()
+		self.previous = set()
+		self.started = None
+
+	def __rotate__(self, now):
+		if self.started is None:
+			self.started = now
+		elif now - self.started >= self.window / 2 or len(self.current) >= self.max_size / 2:
+			self.previous = self.current
+			self.current = set()
+			self.started = now
+
+	def check_and_add(self, key, now):
+		"""
+		:param key: the key to look up.
+		:type key: integer.
+		:param now: the current time, in seconds.
+		:type now: integer.
+		:return: True if the key was already in the set, else False (in which case it's added.)
+		"""
+		self.__rotate__(now)
+		if key in self.current or key in self.previous:
+			return True
+		self.current.add(key)
+		return False
+
+	def __contains__(self, key):
+		return key in self.current or key in self.previous
+
+	def __len__(self):
+		return len(self.current) + len(self.previous)
+
+
+class Deduplicator(object):
+	def __init__(self, window=86400, max_size=1000000, retweets=True, texts=True):
+		"""
+		A dedup stage for the capture pipeline. A tweet is a duplicate if its id has been seen, if
+		it's a retweet of a tweet that's been seen (or retweeted) already, or if its normalized
+		text has been seen. Memory stays fixed however long the stream runs (see RotatingSet.)
+		Pass one to Twitterizer.get_tweets, Twitterizer.tweet_iterator, or Twitterator.tweets_to_db.
+		:param window: how long (in seconds of tweet time) to remember tweets for.
+		:type window: integer.
+		:param max_size: the maximum number of tweet ids, of retweeted ids, and of texts to remember.
+		:type max_size: integer.
+		:param retweets: whether to drop retweets of tweets that have already been seen.
+		:type retweets: boolean.
+		:param texts: whether to drop tweets whose text has already been seen.
+		:type texts: boolean.
+		"""
+		self.retweets = retweets
+		self.texts = texts
+		self.ids = RotatingSet(window, max_size)
+		self.retweeted = RotatingSet(window, max_size)
+		self.text_hashes = RotatingSet(window, max_size)
+		self.space_p = re.compile(r'\s+', re.UNICODE)
+		self.munge_p = re.compile(r'@\w+', re.UNICODE)
+		self.rt_p = re.compile(r'^rt @xxxxxxxx:?\s*')
+		self.seen = 0
+		self.dropped = {'id': 0, 'retweet': 0, 'text': 0}
+
+	def normalize(self, text):
+		"""
+		Replaces usernames with '@xxxxxxxx' (as ParsedTweet.get_munged_text does), lowercases the
+		text, collapses whitespace, and strips any leading "RT @xxxxxxxx:".
+		NB: this works on the original text (see ParsedTweet.get_raw_text), not the munged text, which
+		has had every non-ASCII character replaced--so tweets that differ only in emoji, say, would
+		otherwise collide.
+		:param text: the text of a tweet.
+		:type text: string.
+		:return: string.
+		"""
+		text = self.munge_p.sub('@xxxxxxxx', text)
+		text = self.space_p.sub(' ', text.lower()).strip()
+		return self.rt_p.sub('', text)
+
+	def is_duplicate(self, tweet):
+		"""
+		Checks whether a tweet is a duplicate, and remembers it if it isn't.
+		NB: the ids of retweeted tweets are kept apart from the ids of tweets seen, so that a tweet
+		that turns up after a retweet of it isn't mistaken for one already seen.
+		:param tweet: the tweet to check.
+		:type tweet: ParsedTweet object.
+		:return: the reason the tweet is a duplicate ('id', 'retweet', or 'text'), or None.
+		"""
+		self.seen += 1
+		now = tweet_timestamp(tweet)
+		reason = None
+		tid = tweet_id(tweet)
+		if tid is not None and self.ids.check_and_add(tid, now):
+			reason = 'id'
+		elif self.retweets and tweet.metadata and tweet.metadata.get('retweeted_status'):
+			original = tweet.metadata['retweeted_status'].get('id')
+			if original is not None and (original in self.ids or self.retweeted.check_and_add(original, now)):
+				reason = 'retweet'
+		if reason is None and self.texts:
+			if self.text_hashes.check_and_add(hash64(self.normalize(tweet.get_raw_text()))[2], now):
+				reason = 'text'
+		if reason:
+			self.dropped[reason] += 1
+		return reason
+
+	def filter(self, tweets):
+		"""
+		:param tweets: the tweets to deduplicate.
+		:type tweets: iterable of ParsedTweet objects.
+		:return: generator of the ParsedTweet objects that aren't duplicates.
+		"""
+		for tweet in tweets:
+			if not self.is_duplicate(tweet):
+				yield tweet
+
+	def total_dropped(self):
+		return sum(self.dropped.values())
+
+	def report(self):
+		"""
+		:return: string summarizing how many tweets were seen and dropped, and why.
+		"""
+		dropped = self.total_dropped()
+		return "{0} of {1} tweets dropped as duplicates ({2} by id, {3} retweets, {4} by text)".format(
+			dropped, self.seen, self.dropped['id'], self.dropped['retweet'], self.dropped['text'])
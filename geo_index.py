@@ -0,0 +1,184 @@
+__author__ = 'samuelraker'
+
+import math
+from array import array
+from hash_index import normalize_tag, tweet_id
+
+
+###A uniform grid over the coordinates of geotagged tweets, for area queries and
+###regional hashtag breakdowns.
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lon1, lat1, lon2, lat2):
+	"""
+	:return: float, the great-circle distance between two points, in kilometers.
+	"""
+	lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+	a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+	return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def wrap_lon(lon):
+	"""
+	:return: float, the longitude moved into [-180, 180].
+	"""
+	if -180 <= lon <= 180:
+		return lon
+	return (lon + 180) % 360 - 180
+
+
+def lon_ranges(min_lon, max_lon):
+	"""
+	Splits a range of longitudes that crosses the antimeridian in two.
+	:param min_lon: the western edge. If it's east of max_lon once both are wrapped into [-180, 180]
+	(e.g. 179 to -179), the range crosses the antimeridian.
+	:type min_lon: float.
+	:param max_lon: the eastern edge.
+	:type max_lon: float.
+	:return: list of (western edge, eastern edge) tuples, none of which crosses the antimeridian.
+	"""
+	if max_lon - min_lon >= 360:
+		return [(-180.0, 180.0)]
+	min_lon = wrap_lon(min_lon)
+	max_lon = wrap_lon(max_lon)
+	if min_lon <= max_lon:
+		return [(min_lon, max_lon)]
+	return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+class GeoIndex(object):
+	def __init__(self, cell_size=0.5):
+		"""
+		Stores the coordinates of geotagged tweets once, as float arrays, and buckets them into
+		a uniform grid of cell_size x cell_size degree cells. Each cell also keeps a count of the
+		hashtags used in it.
+		NB: tweets without coordinates are skipped.
+		:param cell_size: the width and height of each cell, in degrees.
+		:type cell_size: float.
+		"""
+		self.cell_size = float(cell_size)
+		self.lons = array('d')
+		self.lats = array('d')
+		self.ids = array('l')
+		self.cells = {}
+		self.hashtag_counts = {}
+
+	def cell(self, lon, lat):
+		"""
+		:return: tuple of integers, the grid cell containing a point.
+		"""
+		return int(math.floor(lon / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+	def add(self, lon, lat, tid=-1, hashtags=None):
+		"""
+		:param lon: the longitude of the tweet.
+		:type lon: float.
+		:param lat: the latitude of the tweet.
+		:type lat: float.
+		:param tid: the id of the tweet.
+		:type tid: integer.
+		:param hashtags: the tweet's hashtags.
+		:type hashtags: list of strings.
+		"""
+		lon = float(lon)
+		lat = float(lat)
+		cell = self.cell(lon, lat)
+		self.cells.setdefault(cell, array('l')).append(len(self.ids))
+		self.lons.append(lon)
+		self.lats.append(lat)
+		self.ids.append(tid)
+		if hashtags:
+			counts = self.hashtag_counts.setdefault(cell, {})
+			for tag in hashtags:
+				tag = normalize_tag(tag)
+				counts[tag] = counts.get(tag, 0) + 1
+
+	def add_tweet(self, tweet):
+		"""
+		:param tweet: the tweet to add.
+		:type tweet: ParsedTweet object.
+		:return: boolean, whether the tweet had coordinates (and so was added.)
+		"""
+		coordinates = tweet.get_coordinates()
+		if not coordinates:
+			return False
+		tid = tweet_id(tweet)
+		self.add(coordinates[0], coordinates[1], tid if tid is not None else -1, tweet.get_hashes())
+		return True
+
+	def add_tweets(self, tweets):
+		for tweet in tweets:
+			self.add_tweet(tweet)
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __cells_in__(self, min_lon, min_lat, max_lon, max_lat):
+		"""
+		:return: list of the non-empty cells that overlap a bounding box, which may cross the
+		antimeridian (see lon_ranges, above.)
+		"""
+		cells = []
+		for west, east in lon_ranges(min_lon, max_lon):
+			x1, y1 = self.cell(west, min_lat)
+			x2, y2 = self.cell(east, max_lat)
+			if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self.cells):
+				cells += [c for c in self.cells if x1 <= c[0] <= x2 and y1 <= c[1] <= y2]
+			else:
+				cells += [(x, y) for x in xrange(x1, x2 + 1) for y in xrange(y1, y2 + 1) if (x, y) in self.cells]
+		return cells
+
+	def bbox(self, min_lon, min_lat, max_lon, max_lat):
+		"""
+		Which tweets were sent from inside a bounding box?
+		NB: if min_lon is greater than max_lon, the box crosses the antimeridian, e.g.
+		bbox(179, -1, -179, 1) is the two degrees of longitude either side of it.
+		:return: list of tweet ids.
+		"""
+		lons, lats, ids = self.lons, self.lats, self.ids
+		found = []
+		for west, east in lon_ranges(min_lon, max_lon):
+			for cell in self.__cells_in__(west, min_lat, east, max_lat):
+				for row in self.cells[cell]:
+					if west <= lons[row] <= east and min_lat <= lats[row] <= max_lat:
+						found.append(ids[row])
+		return found
+
+	def radius(self, lon, lat, km):
+		"""
+		Which tweets were sent from within a certain distance of a point? The search wraps around
+		the antimeridian.
+		:param lon: the longitude of the point.
+		:type lon: float.
+		:param lat: the latitude of the point.
+		:type lat: float.
+		:param km: the distance, in kilometers.
+		:type km: float.
+		:return: list of tweet ids.
+		"""
+		dlat = math.degrees(km / EARTH_RADIUS_KM)
+		coslat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+		dlon = min(180.0, dlat / coslat)
+		lons, lats, ids = self.lons, self.lats, self.ids
+		found = []
+		for cell in self.__cells_in__(lon - dlon, lat - dlat, lon + dlon, lat + dlat):
+			for row in self.cells[cell]:
+				if haversine(lon, lat, lons[row], lats[row]) <= km:
+					found.append(ids[row])
+		return found
+
+	def hashtags(self, min_lon=-180, min_lat=-90, max_lon=180, max_lat=90):
+		"""
+		Counts the hashtags used in every cell that overlaps a bounding box.
+		NB: counts are kept per cell, so the bounding box is effectively rounded out to the
+		nearest cell boundaries. As with bbox, above, min_lon > max_lon crosses the antimeridian.
+		:return: dictionary of hashtag: count.
+		"""
+		totals = {}
+		for cell in self.__cells_in__(min_lon, min_lat, max_lon, max_lat):
+			for tag, n in self.hashtag_counts.get(cell, {}).iteritems():
+				totals[tag] = totals.get(tag, 0) + n
+		return totals
@@ -1,20 +1,115 @@
 __author__ = 'samuelraker'
 
 import os
-
-os.environ['DJANGO_SETTINGS_MODULE'] = 'samrakerdotcom.settings'
 import re
 import json
 import time
-import twitter
-from hash_to_hash.models import Tweet
-from hash_to_hash.models import Hashtag
-from hash_to_hash.models import Competitors
-from django.db import IntegrityError
-from django.db import DatabaseError
-
+from tokenize_tweet import get_tokenizer
+from tokenize_tweet import whitespace
+from instrument import METRICS
+from instrument import Progress
+from instrument import event
+from instrument import log
+from checkpoint import get_checkpoint
+from pair_cache import PairCache
+
+
+###twitter and Django are slow to import, and Django needs settings, so they're only imported
+###by the classes that use them (see load_twitter and load_django, below.) Nothing is read from the
+###environment, and no requests are made, until Twitter credentials are first needed (see get_AUTH.)
+twitter = None
+Tweet = None
+Hashtag = None
+Competitors = None
+IntegrityError = None
+DatabaseError = None
 
 _AUTH = None
+_AUTH_CHECKED = False
+
+
+def load_twitter():
+	"""
+	Imports the twitter module the first time it's needed.
+	:return: the twitter module.
+	"""
+	global twitter
+	if twitter is None:
+		import twitter as twitter_module
+		twitter = twitter_module
+	return twitter
+
+
+def load_django():
+	"""
+	Imports the Django models and database exceptions the first time they're needed.
+	NB: DJANGO_SETTINGS_MODULE defaults to samrakerdotcom.settings if it isn't already set.
+	"""
+	global Tweet, Hashtag, Competitors, IntegrityError, DatabaseError
+	if Tweet is None:
+		os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'samrakerdotcom.settings')
+		from django.db import IntegrityError, DatabaseError
+		from hash_to_hash.models import Tweet, Hashtag, Competitors
+
+
+def next_pk(model):
+	"""
+	:return: integer, one more than the largest pk of a model in the database (or 1 if it's empty.)
+	"""
+	last = model.objects.order_by('-pk').values_list('pk', flat=True)[:1]
+	return last[0] + 1 if last else 1
+
+
+def next_free_pk(model, pk):
+	"""
+	Call after saving a row with a given pk raised an IntegrityError.
+	:param model: the model the row belongs to.
+	:type model: Django model class.
+	:param pk: the pk the row was given.
+	:type pk: integer.
+	:return: integer, the pk to retry with: one past the largest in the table, so that a run of
+	taken pks costs one retry rather than one per pk. None if pk isn't taken--i.e. the error
+	wasn't a pk collision, and retrying with another pk won't help.
+	"""
+	if not model.objects.filter(pk=pk).exists():
+		return None
+	return max(pk + 1, next_pk(model))
+
+
+def atomic():
+	"""
+	:return: a context manager that commits a block as one transaction, whatever the Django version.
+	"""
+	from django.db import transaction
+	if hasattr(transaction, 'atomic'):
+		return transaction.atomic()
+	return transaction.commit_on_success()
+
+
+def parse_line(line):
+	"""
+	Turns a line of a JSON capture into a ParsedTweet object. Lines written by to_json, below, hold
+	[text, metadata] lists; lines holding raw tweet dictionaries, as the Streaming API returns them,
+	are accepted too.
+	:param line: the line.
+	:type line: string.
+	:return: ParsedTweet object, or None if the line isn't valid JSON or doesn't hold a tweet.
+	"""
+	try:
+		record = json.loads(line)
+	except ValueError:
+		return None
+	if isinstance(record, list) and len(record) >= 2:
+		text, metadata = record[:2]
+	elif isinstance(record, dict):
+		text, metadata = record.get('text'), record
+	else:
+		return None
+	if not (isinstance(text, basestring) and isinstance(metadata, dict) and
+	        isinstance(metadata.get('user'), dict) and 'id' in metadata['user']):
+		return None
+	return ParsedTweet(text, metadata)
+
 
 def unifilter(s):
 	try:
@@ -49,19 +144,22 @@ def unicheck(c):
 
 def set_AUTH(token, token_secret, consumer_key, consumer_secret):
 	"""
-
+	Checks a set of Twitter OAuth credentials (this makes a request to the API) and, if they work,
+	saves them as _AUTH.
 	:param token:
 	:param token_secret:
 	:param consumer_key:
 	:param consumer_secret:
 	"""
+	global _AUTH, _AUTH_CHECKED
+	load_twitter()
+	_AUTH_CHECKED = True
 	_auth = twitter.oauth.OAuth(token, token_secret, consumer_key, consumer_secret)
 	t = twitter.Twitter(auth=_auth)
 	try:
 		test = t.statuses.home_timeline()
 		del t # only needed to check that _auth is working.
 		del test
-		global _AUTH
 		_AUTH = _auth
 		print """Success!
 Your Twitter OAuth credentials have been successfully retrieved.
@@ -72,25 +170,27 @@ You can now set _auth=_AUTH for any classes that require OAuth credentials.
 		print errors["errors"][0]["message"]
 
 
-TOKEN = os.environ.get("TWITTER_TOKEN", -1)
-if TOKEN == -1:
-	print """TWITTER_TOKEN environment variable not found.
-			Please supply it manually, or set it via the command line"""
-TOKEN_SECRET = os.environ.get("TWITTER_TOKEN_SECRET", -1)
-if TOKEN_SECRET == -1:
-	print """TWITTER_TOKEN_SECRET environment variable not found.
-			Please supply it manually, or set it via the command line"""
-CONSUMER_KEY = os.environ.get("TWITTER_CONSUMER_KEY", -1)
-if CONSUMER_KEY == -1:
-	print """TWITTER_CONSUMER_KEY environment variable not found.
-			Please supply it manually, or set it via the command line."""
-CONSUMER_SECRET = os.environ.get("TWITTER_CONSUMER_SECRET", -1)
-if CONSUMER_SECRET == -1:
-	print """TWITTER_CONSUMER_SECRET environment variable not found.
-			Please supply it manually, or set it via the command line."""
-
-if TOKEN != -1 and TOKEN_SECRET != -1 and CONSUMER_KEY != -1 and CONSUMER_SECRET != -1:
-	set_AUTH(TOKEN, TOKEN_SECRET, CONSUMER_KEY, CONSUMER_SECRET)
+def get_AUTH():
+	"""
+	Returns the Twitter OAuth credentials set via the TWITTER_TOKEN, TWITTER_TOKEN_SECRET,
+	TWITTER_CONSUMER_KEY, and TWITTER_CONSUMER_SECRET environment variables.
+	The environment variables are only read, and the credentials only checked (see set_AUTH, above),
+	the first time this is called; after that, the result is cached.
+	:return: twitter.oauth.OAuth object, or None if the credentials are missing or don't work.
+	"""
+	global _AUTH_CHECKED
+	if not _AUTH_CHECKED:
+		credentials = []
+		for var in ("TWITTER_TOKEN", "TWITTER_TOKEN_SECRET", "TWITTER_CONSUMER_KEY", "TWITTER_CONSUMER_SECRET"):
+			credentials.append(os.environ.get(var, -1))
+			if credentials[-1] == -1:
+				print """{} environment variable not found.
+			Please supply it manually, or set it via the command line.""".format(var)
+		if -1 in credentials:
+			_AUTH_CHECKED = True
+		else:
+			set_AUTH(*credentials)
+	return _AUTH
 
 
 class ParsedTweet(object):
@@ -109,14 +209,17 @@ class ParsedTweet(object):
 		:param metadata: the rest of the twitter metadata (although it doesn't really matter if text is
 		included here also.)
 		:type metadata: dictionary
-		:param tokenize: a tokenization function, e.g. one that takes a string and returns a list of tokens.
+		:param tokenize: a tokenization function, e.g. one that takes a string and returns a list of tokens,
+		or the name of one of the tokenizers in tokenize_tweet ('whitespace', 'tweet', or 'hashtag'.)
 		The default is a simple whitespace-based tokenizer (see .__split__, below.)
-		:type tokenize: function
-		"""
-		self.tokenize = tokenize or self.__split__
-		self.text = text or metadata.get('text', '')
-		self.text = self.text.encode('utf8', 'replace').decode('ascii', 'replace')
-		self.tokenized_text = self.tokenize(text)
+		:type tokenize: function or string
+		"""
+		self.tokenize = get_tokenizer(tokenize) if tokenize else self.__split__
+		self.raw_text = text or metadata.get('text', '')
+		self.text = self.raw_text.encode('utf8', 'replace').decode('ascii', 'replace')
+		with METRICS.timer('tokenize'):
+			self.tokenized_text = self.tokenize(self.text)
+		self.decoded_tokens = None
 		self.munge_p = re.compile(r'@[\w\d_]+')
 		self.munged_text = re.sub(self.munge_p, '@xxxxxxxx', self.text)
 		self.metadata = metadata
@@ -131,7 +234,9 @@ class ParsedTweet(object):
 			except KeyError:
 				self.hashtags = None
 		self.hashtags = self.hashtags or re.findall(r'#[\w_\d]+', text)
-		self.uid = self.get_meta('user')['id']
+		user = self.get_meta('user')
+		self.uid = user['id'] if user else None
+		self.coords = False
 
 	def __get_meta_key__(self, metadata):
 		"""
@@ -156,7 +261,7 @@ class ParsedTweet(object):
 		:type s: string.
 		:return: list of strings.
 		"""
-		return re.split(r'\s+', s)
+		return whitespace(s)
 
 	def get_meta(self, value=None, verbose=False):
 		"""
@@ -207,6 +312,13 @@ class ParsedTweet(object):
 	def get_text(self):
 		return self.text
 
+	def get_raw_text(self):
+		"""
+		Returns the text of the tweet as it was given, before non-ASCII characters were replaced.
+		:return: string
+		"""
+		return self.raw_text
+
 	def get_munged_text(self):
 		"""
 		Returns the text of the tweet with all usernames replaced with '@xxxxxxxx'
@@ -223,12 +335,16 @@ class ParsedTweet(object):
 	def get_tokenized_text(self, decode=True):
 		"""
 		Returns the text as tokenized by the function passed in .__init__, or by .__split__, above.
-		:param decode: if True, the text will be decoded from unicode.
+		:param decode: if True, tokens that are byte strings are decoded from UTF-8 (tokens that are
+		already unicode are returned as they are.)
 		:type decode: boolean.
 		:return: list of strings.
 		"""
 		if decode:
-			return [word.decode('utf8') for word in self.tokenized_text]
+			if self.decoded_tokens is None:
+				self.decoded_tokens = [word.decode('utf8') if isinstance(word, str) else word
+				                       for word in self.tokenized_text]
+			return self.decoded_tokens
 		else:
 			return self.tokenized_text
 
@@ -239,14 +355,16 @@ class ParsedTweet(object):
 		NB: the geolocation data provided by Twitter is, IMHO, a bit of a mess. There are
 		sometimes multiple lists of coordinates--I'm not sure what they all represent.
 		In these cases, I've made the (arbitrary) choice to use the first set.
+		NB: the coordinates are only unwrapped the first time this is called.
 		:return: list of strings (longitude, latitude)
 		"""
-		if self.get_meta('coordinates'):
-			coordinates = self.get_meta('coordinates')
-			while isinstance(coordinates[0], list):
-				coordinates = coordinates[0]
-			else:
-				return coordinates
+		if self.coords is False:
+			coordinates = self.get_meta('coordinates') or None
+			if coordinates:
+				while isinstance(coordinates[0], list):
+					coordinates = coordinates[0]
+			self.coords = coordinates
+		return self.coords
 
 	def get_uid(self):
 		return self.uid
@@ -257,13 +375,13 @@ class ParsedTweet(object):
 		NB: The way I've implemented it, each ParsedTweet object is serialized to a separate line of JSON.
 		This allows one file to be appended with new ParsedTweet JSON representations, but also means that
 		one needs to decode said file line-by-line. See json_to_parsed, below.
-		:param verbose: whether to print a notice that the object is being serialized.
+		:param verbose: whether to log (at debug level) a notice that the object is being serialized.
 		:type verbose: boolean.
 		:return: string representation of the JSON serialization of the object.
 		"""
 		if verbose:
-			print "serializing {}".format(self.__repr__())
-		return json.dumps([self.get_text(), self.get_meta()])
+			log.debug("serializing %r", self)
+		return json.dumps([self.get_raw_text(), self.get_meta()])
 
 
 class Search(object):
@@ -278,6 +396,7 @@ class Search(object):
 		https://dev.twitter.com/apps for more information.
 		:type _auth: function
 		"""
+		load_twitter()
 		self.__auth__ = _auth or twitter.oauth.OAuth(token="",
 		                                             token_secret="",
 		                                             consumer_key="",
@@ -395,21 +514,32 @@ class Twitterizer(object):
 		for more information.
 		:param _auth: your twitter authentication. See the documentation under Search, above.
 		:type _auth: function
-		:param stream: a twitter.TwitterStream object to pull the tweets from.
+		:param stream: a twitter.TwitterStream object to pull the tweets from, or a stand-in for one
+		such as replay.ReplayStream (in which case the twitter module isn't needed at all.)
 		:type stream: twitter.TwitterStream object.
 		:param sample: a twitter.stream.statuses.sample object
 		"""
-		self.__auth__ = _auth or twitter.oauth.OAuth(token="", token_secret="", consumer_key="", consumer_secret="")
+		self.__auth__ = _auth
 		self.stream = stream or self.get_stream()
 		self.sample = sample or self.get_sample(self.stream)
 		self.tweets = []
 
+	def get_auth(self):
+		"""
+		:return: the authentication passed to .__init__, or empty OAuth credentials if there wasn't any.
+		"""
+		if self.__auth__ is None:
+			load_twitter()
+			self.__auth__ = twitter.oauth.OAuth(token="", token_secret="", consumer_key="", consumer_secret="")
+		return self.__auth__
+
 	def get_stream(self):
 		"""
 		get a new TwitterStream stream.
 		:return: twitter.TwitterStream object.
 		"""
-		return twitter.TwitterStream(auth=self.__auth__)
+		load_twitter()
+		return twitter.TwitterStream(auth=self.get_auth())
 
 	def get_sample(self, stream):
 		"""
@@ -419,7 +549,7 @@ class Twitterizer(object):
 		return stream.statuses.sample()
 
 	def get_tweets(self, sample=None, hash_only=True, limit=100, lang='en', lang_none=False, meta=True, tokenize=None,
-	               verbose=True):
+	               verbose=True, stats=None, dedup=None):
 		"""
 		Retrieve tweets from a sample.
 		:param sample: a pre-existing twitter.stream.statuses.sample object
@@ -438,8 +568,12 @@ class Twitterizer(object):
 		:param tokenize: a tokenization function that gets used to tokenize the text of the ParsedTweet objects.
 		See the documentation for the ParsedTweet class, above.
 		:type tokenize: function.
-		:param verbose: whether to print the number of tweets returned.
+		:param verbose: whether to log the number of tweets returned.
 		:type verbose: boolean.
+		:param stats: if given, the returned tweets' hashtags are counted by it.
+		:type stats: hash_stats.HashtagStats object.
+		:param dedup: if given, tweets it considers duplicates are dropped (and don't count towards the limit.)
+		:type dedup: dedup.Deduplicator object.
 		:return: list of ParsedTweet objects.
 		"""
 		sample = sample or self.sample
@@ -447,44 +581,81 @@ class Twitterizer(object):
 		tweets = []
 		while i < limit:
 			try:
-				tweet = sample.next()
-				if 'text' in tweet.keys():
-					if (not (lang_none == ('lang' in tweet.keys()))) and tweet["lang"] == lang:
-						if hash_only:
-							if tweet["entities"]["hashtags"]:
-								if meta:
-									metadata = {}
-									for k in tweet.keys():
-										if k != "text":
-											metadata[k] = tweet[k]
-								else:
-									metadata = None
-								tweets.append(ParsedTweet(tweet["text"], metadata, tokenize))
-								i += 1
-						else:
-							if meta:
-								metadata = {}
-								for k in tweet.keys():
-									if k != "text":
-										metadata[k] = tweet[k]
-							else:
-								metadata = None
-							tweets.append(ParsedTweet(tweet["text"], metadata))
-							i += 1
+				tweet = self.next_tweet(sample, hash_only, meta, lang, lang_none, tokenize, dedup)
+				if tweet:
+					tweets.append(tweet)
+					i += 1
 			except StopIteration:
 				if i > 0:
 					more = "more "
 				else:
 					more = ""
-				print "sample seems not to have any {}tweets".format(more)
+				event('get_tweets', exhausted=True, message="sample seems not to have any {}tweets".format(more))
 				break
 		if verbose:
-			print "{} tweets returned".format(i)
+			if dedup is not None:
+				event('get_tweets', returned=i, seen=dedup.seen, duplicates=dedup.total_dropped())
+			else:
+				event('get_tweets', returned=i)
+		if stats is not None:
+			stats.add_tweets(tweets)
 		return tweets
 
-	def parse_tweet(self, raw_tweet, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None):
+	def next_tweet(self, sample, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None, dedup=None):
+		"""
+		Reads one tweet from a sample and parses it (see parse_tweet, below), recording metrics
+		for each stage.
+		:return: ParsedTweet object, or None if the record isn't a tweet (see is_tweet, below), or the
+		tweet was filtered out or is a duplicate.
+		:raises: StopIteration if the sample is exhausted.
+		"""
+		with METRICS.timer('stream.read'):
+			raw_tweet = sample.next()
+		METRICS.incr('stream.read')
+		if not self.is_tweet(raw_tweet, hash_only):
+			METRICS.incr('filter.malformed')
+			return None
+		with METRICS.timer('parse'):
+			tweet = self.parse_tweet(raw_tweet, hash_only, meta, lang, lang_none, tokenize)
+		if not tweet:
+			METRICS.incr('filter.dropped')
+		elif dedup is not None and dedup.is_duplicate(tweet):
+			METRICS.incr('filter.duplicates')
+		else:
+			METRICS.incr('parse')
+			return tweet
+
+	@staticmethod
+	def is_tweet(raw_tweet, hash_only=True):
+		"""
+		Checks that a record from the stream has what parse_tweet needs: text, a user with an id, and
+		(if hash_only) hashtag entities. Delete and limit notices, and tweets missing any of those,
+		aren't tweets as far as parse_tweet is concerned.
+		:param raw_tweet: the record.
+		:type raw_tweet: anything.
+		:param hash_only: whether the record needs hashtag entities.
+		:type hash_only: boolean.
+		:return: boolean.
+		"""
+		if not (isinstance(raw_tweet, dict) and isinstance(raw_tweet.get('text'), basestring)):
+			return False
+		user = raw_tweet.get('user')
+		if not (isinstance(user, dict) and 'id' in user):
+			return False
+		if 'entities' not in raw_tweet:
+			return not hash_only
+		entities = raw_tweet['entities']
+		if not isinstance(entities, dict):
+			return False
+		if 'hashtags' not in entities:
+			return not hash_only
+		hashtags = entities['hashtags']
+		return isinstance(hashtags, list) and all(isinstance(ht, dict) and 'text' in ht for ht in hashtags)
+
+	@staticmethod
+	def parse_tweet(raw_tweet, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None):
 		if 'text' in raw_tweet.keys():
-			if (not (lang_none == ('lang' in raw_tweet.keys()))) and raw_tweet["lang"] == lang:
+			if raw_tweet.get('lang') == lang or (lang_none and raw_tweet.get('lang') is None):
 				if hash_only:
 					if raw_tweet["entities"]["hashtags"]:
 						if meta:
@@ -505,20 +676,24 @@ class Twitterizer(object):
 						metadata = None
 					return ParsedTweet(raw_tweet["text"], metadata, tokenize)
 
-	def tweet_iterator(self, sample=None, limit=100, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None):
+	def tweet_iterator(self, sample=None, limit=100, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None,
+	                   stats=None, dedup=None):
 		i = 0
-		sample = sample or self.get_sample(self.get_stream())
-		while i <= limit:
+		sample = sample or self.get_sample(self.stream)
+		while i < limit:
 			try:
-				t =  self.parse_tweet(sample.next(), hash_only, meta, lang, lang_none, tokenize)
+				t = self.next_tweet(sample, hash_only, meta, lang, lang_none, tokenize, dedup)
 				if t:
+					if stats is not None:
+						stats.add_tweet(t)
 					yield t
 					i += 1
 			except StopIteration:
 				break
 
-	def get_tweet_iterator(self, sample=None, limit=100, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None):
-		return self.tweet_iterator(sample, limit, hash_only, meta, lang, lang_none, tokenize)
+	def get_tweet_iterator(self, sample=None, limit=100, hash_only=True, meta=True, lang='en', lang_none=False, tokenize=None,
+	                       stats=None, dedup=None):
+		return self.tweet_iterator(sample, limit, hash_only, meta, lang, lang_none, tokenize, stats, dedup)
 
 class Twitterator(object):
 	def __init__(self, infile=None, outfile=None, verbosity=True):
@@ -532,9 +707,9 @@ class Twitterator(object):
 		:param outfile: the name of the file to which to write the fixtures. NB: only one fixture
 		will be written, containing data for all three models.
 		type outfile: string.
-		:param verbosity: whether a message will be printed after each tweet, hashtag, and competitor set
-		is created, and after the fixtures are written to the outfile.
-		:type verbosity: string.
+		:param verbosity: whether progress messages (at most one every few seconds) will be logged while tweets
+		and competitor sets are created, and after the fixtures are written to the outfile.
+		:type verbosity: boolean.
 		NB: As with the ParsedTweet class above, I've tailored the fixtures produced by these classes to
 		my own needs. Feel free to change .tweet_fixture, .hash_fixture, and .competitor_fixture to suit
 		your own purposes!
@@ -547,6 +722,8 @@ class Twitterator(object):
 		self.hash_i = 1
 		self.competitors_i = 1
 		self.verbosity = verbosity
+		self.tweet_progress = Progress('tweets', enabled=verbosity)
+		self.competitor_progress = Progress('competitors', enabled=verbosity)
 		self.tweet_fixture = {
 			'model': 'hash_to_hash.tweet',
 			'pk': 0,
@@ -575,8 +752,10 @@ class Twitterator(object):
 				'votes': 0
 			}
 		}
+		load_django()
 		self.competitors = Competitors.objects.all()
 		self.hashtags = Hashtag.objects.all()
+		self.pair_cache = PairCache()
 
 	def tweet_generator(self):
 		"""
@@ -594,6 +773,34 @@ class Twitterator(object):
 				break
 				print "{0} tweets processed".format(i)
 
+	def tweet_batches(self, offset=0, batch_size=1000):
+		"""
+		Like .tweet_generator, above, but reads the infile a line at a time from a byte offset,
+		and yields the tweets in batches along with where in the file each batch starts and ends.
+		Lines that don't hold a tweet are skipped (see parse_line, above.)
+		:param offset: the byte offset to start reading from.
+		:type offset: integer.
+		:param batch_size: the number of tweets per batch.
+		:type batch_size: integer.
+		:return: (list of ParsedTweet objects, start offset, end offset) tuples.
+		"""
+		with open(self.infile, 'rb') as f:
+			f.seek(offset)
+			while True:
+				start = f.tell()
+				batch = []
+				while len(batch) < batch_size:
+					line = f.readline()
+					if not line:
+						break
+					tweet = parse_line(line)
+					if tweet is not None:
+						batch.append(tweet)
+				end = f.tell()
+				if end == start:
+					break
+				yield batch, start, end
+
 	def parse_tweet(self, tweet):
 		"""
 		Creates a tweet fixture from a ParsedTweet object, making sure the pks are updated.
@@ -607,43 +814,73 @@ class Twitterator(object):
 		tweet_fixture['fields']['uid'] = tweet.get_meta('id')
 		tweet_fixture['fields']['time_zone'] = tweet.get_meta('time_zone')
 		try:
-			tweet_fixture['fields']['lat'] = tweet.get_coordinates()[1]
-			tweet_fixture['fields']['lon'] = tweet.get_coordinates()[0]
+			coordinates = tweet.get_coordinates()
+			tweet_fixture['fields']['lat'] = coordinates[1]
+			tweet_fixture['fields']['lon'] = coordinates[0]
 		except TypeError:
 			pass
-		if self.verbosity:
-			print tweet_fixture
+		self.tweet_progress.update(tweet=self.tweet_i, hashtags=self.hash_i)
 		self.fixtures.append(tweet_fixture)
 		for tag in tweet.get_hashes():
 			self.parse_hash(tag)
 		self.tweet_i += 1
 
-	def tweet_to_db(self, tweet):
+	@staticmethod
+	def make_tweet(tweet, pk):
 		"""
-		Creates a Tweet object from a ParsedTweet object and saves it to the database.
+		Creates (but doesn't save) a Tweet object from a ParsedTweet object.
+		NB: the Django models must already be loaded (see load_django, above.)
+		:param tweet: the tweet.
+		:type tweet: ParsedTweet object.
+		:param pk: the primary key of the new Tweet.
+		:type pk: integer.
+		:return: Tweet object.
 		"""
 		try:
-			lat = tweet.get_coordinates()[1]
-			lon = tweet.get_coordinates()[0]
+			coordinates = tweet.get_coordinates()
+			lat = coordinates[1]
+			lon = coordinates[0]
 		except TypeError:
 			lat = None
 			lon = None
-		t = Tweet(id=self.tweet_i,
-		          text=tweet.text,
-		          munged_text=tweet.munged_text,
-		          uid=tweet.get_uid(),
-		          time_zone=tweet.get_meta('time_zone'),
-		          lat=lat,
-		          lon=lon)
-		try:
-			t.save()
-			for hashtag in tweet.get_hashes():
-				self.hashtag_to_db(hashtag, t)
-		except IntegrityError:
-			self.tweet_i += 1
-			self.tweet_to_db(tweet)
-		else:
-			self.tweet_i += 1
+		return Tweet(id=pk,
+		             text=tweet.text,
+		             munged_text=tweet.munged_text,
+		             uid=tweet.get_uid(),
+		             time_zone=tweet.get_meta('time_zone'),
+		             lat=lat,
+		             lon=lon)
+
+	def tweet_to_db(self, tweet):
+		"""
+		Creates a Tweet object from a ParsedTweet object and saves it to the database.
+		NB: the tweet and its hashtags are saved in their own transaction (or savepoint, if there's
+		already a transaction), so that if a pk is taken, only they are rolled back before retrying
+		with the next free one (see next_free_pk, above)--and any enclosing transaction can carry on.
+		:return: the saved Tweet object.
+		"""
+		METRICS.incr('db.tweets')
+		while True:
+			t = self.make_tweet(tweet, self.tweet_i)
+			hash_i = self.hash_i
+			try:
+				with atomic():
+					with METRICS.timer('db.write'):
+						t.save(force_insert=True)
+					for hashtag in tweet.get_hashes():
+						self.hashtag_to_db(hashtag, t)
+			except IntegrityError:
+				METRICS.incr('db.integrity_errors')
+				self.hash_i = hash_i
+				pk = next_free_pk(Tweet, self.tweet_i)
+				if pk is None:
+					raise
+				self.tweet_i = pk
+			else:
+				break
+		self.tweet_i += 1
+		self.tweet_progress.update(tweet=self.tweet_i, hashtags=self.hash_i)
+		return t
 
 
 	def parse_hash(self, tag):
@@ -658,8 +895,6 @@ class Twitterator(object):
 		hash_fixture['fields']['text'] = tag
 		hash_fixture['fields']['tweet'] = self.tweet_i
 		self.fixtures.append(hash_fixture)
-		if self.verbosity:
-			print hash_fixture
 		self.competitors.append(tag)
 		self.hash_i += 1
 
@@ -673,15 +908,23 @@ class Twitterator(object):
 		NB: While you probably could call this method directly, it's much less messy
 		to let tweet_to_db call it instead.
 		"""
-		h = Hashtag(id=self.hash_i, text=hashtag)
-		try:
-			h.save()
-			h.tweet.add(tweet)
-		except IntegrityError:
-			self.hash_i += 1
-			self.hashtag_to_db(hashtag, tweet)
-		else:
-			self.hash_i += 1
+		METRICS.incr('db.hashtags')
+		while True:
+			h = Hashtag(id=self.hash_i, text=hashtag)
+			try:
+				with atomic():
+					with METRICS.timer('db.write'):
+						h.save(force_insert=True)
+						h.tweet.add(tweet)
+			except IntegrityError:
+				METRICS.incr('db.integrity_errors')
+				pk = next_free_pk(Hashtag, self.hash_i)
+				if pk is None:
+					raise
+				self.hash_i = pk
+			else:
+				break
+		self.hash_i += 1
 
 	def parse_competitors(self, competitor1, competitor2):
 		"""
@@ -695,8 +938,7 @@ class Twitterator(object):
 		competitor_fixture['pk'] = self.competitors_i
 		competitor_fixture['fields']['tag1'] = competitor1
 		competitor_fixture['fields']['tag2'] = competitor2
-		if self.verbosity:
-			print competitor_fixture
+		self.competitor_progress.update(competitors=self.competitors_i)
 		self.fixtures.append(competitor_fixture)
 		self.competitors_i += 1
 
@@ -722,12 +964,71 @@ class Twitterator(object):
 				if competitor1 != competitor:
 					self.parse_competitors(competitor1, competitor)
 
-	def tweets_to_db(self):
+	def tweets_to_db(self, dedup=None, checkpoint=None, batch_size=1000):
 		"""
 		Iterates through .tweet_generator and saves all tweets to the database.
-		"""
-		for tweet in self.tweet_generator():
+		:param dedup: if given, tweets it considers duplicates are skipped.
+		:type dedup: dedup.Deduplicator object.
+		:param checkpoint: if given, the tweets are saved in batches, one transaction each, and the
+		checkpoint records how far into the infile the load has got after every batch. Calling
+		tweets_to_db again with the same checkpoint resumes from there (see resume_tweets_to_db, below.)
+		:type checkpoint: checkpoint.Checkpoint object, or the path to a checkpoint file.
+		:param batch_size: the number of tweets per batch, if checkpointing.
+		:type batch_size: integer.
+		"""
+		if checkpoint is not None:
+			return self.resume_tweets_to_db(get_checkpoint(checkpoint), dedup, batch_size)
+		tweets = self.tweet_generator()
+		if dedup is not None:
+			tweets = dedup.filter(tweets)
+		for tweet in tweets:
 			self.tweet_to_db(tweet)
+			METRICS.tick()
+		if self.verbosity:
+			if dedup is not None:
+				self.tweet_progress.done(seen=dedup.seen, duplicates=dedup.total_dropped())
+			else:
+				self.tweet_progress.done()
+
+	def resume_tweets_to_db(self, checkpoint, dedup=None, batch_size=1000):
+		"""
+		Saves the tweets in the infile to the database in batches, starting from where the checkpoint
+		says an earlier run stopped. Before each batch is committed, the checkpoint notes where it
+		starts and ends and the first pk it will use; after, the checkpoint moves past it. If a run dies
+		between the two, the next one checks whether any tweets were saved from that pk on to decide
+		whether the batch made it in.
+		NB: pks carry on from the largest ones in the database, and it's assumed nothing else
+		writes tweets while the load runs. Dedup state isn't checkpointed.
+		:param checkpoint: the checkpoint.
+		:type checkpoint: checkpoint.Checkpoint object.
+		:param dedup: if given, tweets it considers duplicates are skipped.
+		:type dedup: dedup.Deduplicator object.
+		:param batch_size: the number of tweets per batch.
+		:type batch_size: integer.
+		"""
+		job = 'tweets_to_db:{}'.format(os.path.abspath(self.infile))
+		state = checkpoint.get(job)
+		offset = state.get('offset', 0)
+		pending = state.get('pending')
+		if pending:
+			if Tweet.objects.filter(pk__gte=pending['tweet_i']).exists():
+				offset = pending['end']
+			else:
+				offset = pending['start']
+			checkpoint.update(job, offset=offset, pending=None)
+		self.tweet_i = next_pk(Tweet)
+		self.hash_i = next_pk(Hashtag)
+		for batch, start, end in self.tweet_batches(offset, batch_size):
+			if dedup is not None:
+				batch = list(dedup.filter(batch))
+			checkpoint.update(job, pending={'start': start, 'end': end, 'tweet_i': self.tweet_i})
+			with atomic():
+				for tweet in batch:
+					self.tweet_to_db(tweet)
+			checkpoint.update(job, offset=end, pending=None)
+			METRICS.tick()
+		if self.verbosity:
+			self.tweet_progress.done(offset=checkpoint.get(job).get('offset', offset))
 
 	def __save_comps__(self, tag1, tag2):
 		"""
@@ -738,48 +1039,135 @@ class Twitterator(object):
 		:type tag1: Hashtag object (see hashtag_to_db, above)
 		:param tag2: the second hashtag
 		:type tag2: Hashtag object
-		"""
-		if not self.competitors.filter(tag1__id=tag1.pk).filter(tag2__id=tag2.pk):
-			try:
+		NB: a pair is only saved once, whichever order its hashtags come in. Whether it already exists
+		is checked against .pair_cache (see warm_pair_cache, below), which is only backed up by a
+		query if it's had to evict pairs and its Bloom filter can't rule the pair out.
+		NB: like tweet_to_db, the pair is saved in its own savepoint, so a taken pk doesn't spoil an
+		enclosing transaction.
+		"""
+		METRICS.incr('pairing')
+		if not self.pair_cache.warmed:
+			self.warm_pair_cache()
+		with METRICS.timer('pairing'):
+			exists = self.pair_cache.exists(tag1.pk, tag2.pk, self.pair_exists)
+		if not exists:
+			while True:
 				comps = Competitors(id=self.competitors_i,
 				                    tag1=tag1,
 				                    tag2=tag2,
 				                    yes=0,
 				                    no=0)
-				comps.save()
-			except IntegrityError:
-				self.competitors_i += 1
-				self.save_comps(tag1, tag2)
-			else:
-				self.competitors_i += 1
-
-
-	def competitors_to_db(self, start=1):
+				try:
+					with atomic():
+						with METRICS.timer('db.write'):
+							comps.save(force_insert=True)
+				except IntegrityError:
+					METRICS.incr('db.integrity_errors')
+					pk = next_free_pk(Competitors, self.competitors_i)
+					if pk is None:
+						raise
+					self.competitors_i = pk
+				else:
+					break
+			METRICS.incr('db.competitors')
+			self.pair_cache.add(tag1.pk, tag2.pk)
+			self.competitors_i += 1
+			self.competitor_progress.update(competitors=self.competitors_i)
+
+	def warm_pair_cache(self, max_size=None, bloom_bits=None):
+		"""
+		Loads every existing competitor pair into .pair_cache in one query, and moves .competitors_i
+		past the pks already taken.
+		:param max_size: the maximum number of pairs to keep in memory. Defaults to the cache's current limit.
+		:type max_size: integer.
+		:param bloom_bits: the size of the cache's Bloom filter (see pair_cache.PairCache.) Defaults to
+		the current cache's, unless max_size is given.
+		:type bloom_bits: integer.
+		"""
+		if max_size is None:
+			max_size = self.pair_cache.max_size
+			bloom_bits = bloom_bits or self.pair_cache.bloom.bits
+		self.pair_cache = PairCache(max_size, bloom_bits)
+		self.competitors_i = max(self.competitors_i, next_pk(Competitors))
+		with METRICS.timer('pairing.warm'):
+			self.pair_cache.warm(self.competitors.values_list('tag1_id', 'tag2_id').iterator())
+
+	def pair_exists(self, a, b):
+		"""
+		Checks the database for a competitor pair, in either order, in one query.
+		:param a: the pk of one hashtag.
+		:type a: integer.
+		:param b: the pk of the other.
+		:type b: integer.
+		:return: boolean.
+		"""
+		from django.db.models import Q
+		METRICS.incr('pairing.queries')
+		return self.competitors.filter(Q(tag1__id=a, tag2__id=b) | Q(tag1__id=b, tag2__id=a)).exists()
+
+
+	def competitors_to_db(self, start=1, checkpoint=None, batch_size=1000):
+		"""
+		Saves a Competitors object for every pair of hashtags in the database (that doesn't already have one.)
+		:param start: the pk of the first hashtag to pair.
+		:type start: integer.
+		:param checkpoint: if given, the position of the pairing loop is recorded every batch_size pairs,
+		and a later call with the same checkpoint resumes from there. The checkpoint is cleared once
+		every pair has been made.
+		:type checkpoint: checkpoint.Checkpoint object, or the path to a checkpoint file.
+		:param batch_size: the number of pairs between checkpoints.
+		:type batch_size: integer.
+		"""
+		checkpoint = get_checkpoint(checkpoint)
 		i = start
+		j = None
+		if checkpoint is not None:
+			state = checkpoint.get('competitors_to_db')
+			i = state.get('i', start)
+			j = state.get('j')
+			self.competitors_i = max(self.competitors_i, next_pk(Competitors))
+		pairs = 0
 		while True:
 			try:
 				tag1 = self.hashtags.get(pk=i)
-				j = i + 1
+				j = j or i + 1
 				while True:
 					try:
 						tag2 = self.hashtags.get(pk=j)
 						self.__save_comps__(tag1, tag2)
 						j += 1
+						pairs += 1
+						if checkpoint is not None and pairs % batch_size == 0:
+							checkpoint.update('competitors_to_db', i=i, j=j)
 					except Hashtag.DoesNotExist:
 						break
 				i += 1
+				j = None
+				if checkpoint is not None:
+					checkpoint.update('competitors_to_db', i=i, j=None)
+				METRICS.tick()
 			except Hashtag.DoesNotExist:
 				break
+		if checkpoint is not None:
+			checkpoint.clear('competitors_to_db')
+		self.competitor_progress.done()
 
 	def add_new_competitor(self, tweet):
-		self.tweet_to_db(tweet)
-		tags = Hashtag.objects.filter(tweet__pk=self.tweet_i)
+		"""
+		Saves a tweet (see tweet_to_db, above) and pairs each of its hashtags with every other hashtag
+		in the database (see __save_comps__, above.)
+		:param tweet: the tweet to save.
+		:type tweet: ParsedTweet object.
+		"""
+		saved = self.tweet_to_db(tweet)
+		tags = Hashtag.objects.filter(tweet__pk=saved.pk)
 		for tag in tags:
-			j  = 1
+			j = 1
 			while True:
 				try:
 					tag2 = self.hashtags.get(pk=j)
-					self.__save_comps__(tag, tag2)
+					if tag2.pk != tag.pk:
+						self.__save_comps__(tag, tag2)
 					j += 1
 				except Hashtag.DoesNotExist:
 					break
@@ -791,20 +1179,34 @@ class Twitterator(object):
 		with open(self.outfile, "w") as f:
 			json.dump(self.fixtures, f)
 		if self.verbosity:
-			print "Wrote {} tweets, {} hashtags, and {} competitors to {}".format(self.tweet_i, self.hash_i,
-			                                                                      self.competitors_i)
+			event('write_fixtures', tweets=self.tweet_i, hashtags=self.hash_i, competitors=self.competitors_i,
+			      outfile=self.outfile)
 
 
-def json_to_db(infile):
+def json_to_db(infile, workers=1, checkpoint=None):
 	"""
 	Creates a Twitterator object from a JSON file and saves the ParsedTweet objects, hashtags,
 	and competitor pairs to the database.
 	:param infile: the path to the JSON file.
 	:type infile: string
+	:param workers: if more than 1, the file is split into shards and loaded by that many worker
+	processes (see ingest.sharded_json_to_db.)
+	:type workers: integer
+	:param checkpoint: if given, the load is checkpointed, and an interrupted load will resume where it
+	stopped when json_to_db is called again with the same checkpoint.
+	:type checkpoint: checkpoint.Checkpoint object, or the path to a checkpoint file.
+	:raises: ValueError if both workers (more than 1) and checkpoint are given--a parallel load
+	can't be resumed.
 	"""
+	if workers > 1 and checkpoint is not None:
+		raise ValueError("json_to_db can't checkpoint a load with more than one worker")
+	if workers > 1:
+		from ingest import sharded_json_to_db
+		return sharded_json_to_db(infile, workers)
+	checkpoint = get_checkpoint(checkpoint)
 	t = Twitterator(infile)
-	t.tweets_to_db()
-	t.competitors_to_db()
+	t.tweets_to_db(checkpoint=checkpoint)
+	t.competitors_to_db(checkpoint=checkpoint)
 
 
 def json_to_parsed(infile, maximum=None):
@@ -840,10 +1242,19 @@ def to_json(tweets, outfile):
 	s = "{}\n".format("\n".join((tweet.to_json() for tweet in tweets)))
 	with open(outfile, "a") as f:
 		f.write(s)
-	print "{} tweets written to {}".format(len(tweets), outfile)
+	event('to_json', tweets=len(tweets), outfile=outfile)
 
 
-def longitudinal(outfile="tweets6-23.json", interval=3600, limit=1000):
+def check_index(index):
+	"""
+	Fails before any tweets are read, rather than after the first batch, if an index that's to be
+	saved after every batch has nowhere to be saved.
+	"""
+	if index is not None and not index.path:
+		raise ValueError("the index has no directory to save to; make it with HashIndex(path)")
+
+
+def longitudinal(outfile="tweets6-23.json", interval=3600, limit=1000, index=None, dedup=None, stream=None):
 	"""
 	Periodically retrieves a certain number of tweets from the Twitter stream.
 	:param outfile: the name of the file to which to write the retrieved tweets.
@@ -852,27 +1263,63 @@ def longitudinal(outfile="tweets6-23.json", interval=3600, limit=1000):
 	:type interval: integer.
 	:param limit: the number of tweets to retrieve at a go.
 	:type limit: integer.
+	:param index: if given, each batch of tweets is also added to the index, which is saved after every batch.
+	:type index: hash_index.HashIndex object.
+	:param dedup: if given, duplicate tweets are dropped across batches.
+	:type dedup: dedup.Deduplicator object.
+	:param stream: the stream to read from instead of the Twitter API, e.g. a replay.ReplayStream.
+	:type stream: twitter.TwitterStream object.
+	:raises: ValueError if index has no path to be saved to.
 	"""
+	check_index(index)
 	while True:
-		t = Twitterizer(_auth=_AUTH)
-		print "getting tweets..."
-		tweets = t.get_tweets(limit=limit)
-		print "saving tweets"
+		t = Twitterizer(_auth=None if stream else get_AUTH(), stream=stream)
+		event('longitudinal', state='getting tweets')
+		tweets = t.get_tweets(limit=limit, dedup=dedup)
+		event('longitudinal', state='saving tweets', tweets=len(tweets))
 		to_json(tweets, outfile)
-		print "sleeping for {} seconds".format(interval)
+		if index is not None:
+			index.add_tweets(tweets)
+			index.save()
+		METRICS.tick()
+		event('longitudinal', state='sleeping', seconds=interval)
 		time.sleep(interval)
 
 
-def longitudinal_to_db(_auth=_AUTH, interval=3600, limit=1000):
+def longitudinal_to_db(_auth=None, interval=3600, limit=1000, index=None, dedup=None, stream=None):
+	"""
+	Periodically retrieves a certain number of tweets from the Twitter stream and saves them,
+	their hashtags, and any new competitor pairs to the database.
+	:param _auth: your twitter authentication. If None, the credentials from the environment are used
+	(see get_AUTH, above.)
+	:type _auth: twitter.oauth.OAuth object.
+	:param index: if given, each tweet is also added to the index, which is saved after every batch.
+	:type index: hash_index.HashIndex object.
+	:param dedup: if given, duplicate tweets are dropped across batches.
+	:type dedup: dedup.Deduplicator object.
+	:param stream: the stream to read from instead of the Twitter API, e.g. a replay.ReplayStream.
+	:type stream: twitter.TwitterStream object.
+	:raises: ValueError if index has no path to be saved to.
+	"""
+	check_index(index)
+	if stream is None:
+		_auth = _auth or get_AUTH()
 	ator = Twitterator()
 	while True:
-		t = Twitterizer(_auth)
-		print "getting tweets..."
-		tweets = t.get_tweet_iterator(limit=limit)
-		print "saving tweets"
+		t = Twitterizer(_auth, stream)
+		event('longitudinal_to_db', state='getting tweets')
+		tweets = t.get_tweet_iterator(limit=limit, dedup=dedup)
+		event('longitudinal_to_db', state='saving tweets')
 		for tweet in tweets:
 			ator.add_new_competitor(tweet)
-		print "sleeping for {0} seconds".format(interval)
+			if index is not None:
+				index.add_tweet(tweet)
+		if index is not None:
+			index.save()
+		if dedup is not None:
+			event('longitudinal_to_db', seen=dedup.seen, duplicates=dedup.total_dropped())
+		METRICS.tick()
+		event('longitudinal_to_db', state='sleeping', seconds=interval)
 		time.sleep(interval)
 
 
@@ -0,0 +1,586 @@
+__author__ = 'samuelraker'
+
+import os
+import json
+import time
+import calendar
+from array import array
+from heapq import merge
+from itertools import izip, islice
+from bisect import bisect_left, bisect_right
+
+
+###An on-disk inverted index from hashtags to the tweets that used them, and a forward map from
+###tweets to their hashtags, so range and co-occurrence queries don't need to touch the JSON
+###captures or the database.
+###Saves only append to the postings file (compacting writes a new one), and the header that says
+###what's in it is replaced atomically, last, so a save that dies part-way leaves the index as it was.
+
+
+#the most out-of-order postings Postings.flush inserts one at a time, rather than merging.
+INSERT_LIMIT = 64
+
+
+def normalize_tag(tag):
+	"""
+	Hashtags are case-insensitive on Twitter, and the regex fallback in ParsedTweet
+	keeps the leading '#', so both are stripped before a tag is interned.
+	:param tag: the hashtag.
+	:type tag: string.
+	:return: string.
+	"""
+	return tag.lstrip('#').lower()
+
+
+def tweet_id(tweet):
+	"""
+	Gets the id of a tweet. NB: the flattened metadata in ParsedTweet.meta_key lets the
+	user's id clobber the tweet's id, so the unflattened metadata is used instead.
+	:param tweet: the tweet.
+	:type tweet: ParsedTweet object.
+	:return: integer, or None if the tweet has no metadata.
+	"""
+	if tweet.metadata:
+		return tweet.metadata.get('id')
+
+
+def tweet_timestamp(tweet, default=None):
+	"""
+	Gets the time a tweet was created at, in seconds since the epoch.
+	:param tweet: the tweet.
+	:type tweet: ParsedTweet object.
+	:param default: the value to return if the tweet has no usable creation time.
+	If None, the current time is used.
+	:type default: integer.
+	:return: integer.
+	"""
+	if tweet.metadata:
+		if 'timestamp_ms' in tweet.metadata:
+			return int(tweet.metadata['timestamp_ms']) // 1000
+		created_at = tweet.metadata.get('created_at')
+		if created_at:
+			try:
+				return calendar.timegm(time.strptime(created_at, '%a %b %d %H:%M:%S +0000 %Y'))
+			except ValueError:
+				pass
+	if default is None:
+		return int(time.time())
+	return default
+
+
+def is_sorted(values):
+	"""
+	:return: boolean, whether values are in ascending order (ties allowed.)
+	"""
+	return all(a <= b for a, b in izip(values, islice(values, 1, None)))
+
+
+def to_run(pairs):
+	"""
+	:param pairs: postings, in any order. If a tweet id appears more than once, its last time is kept.
+	:type pairs: iterable of (tweet id, time) tuples.
+	:return: (array of tweet ids, array of times) tuple, sorted by tweet id.
+	"""
+	pairs = sorted(dict(pairs).items())
+	return array('l', (tid for tid, _ in pairs)), array('l', (ts for _, ts in pairs))
+
+
+def merge_runs(runs):
+	"""
+	Merges runs of postings into one. Runs that follow each other in id order (the usual case, since
+	tweet ids grow over time) are just concatenated.
+	:param runs: the runs, each sorted by tweet id, with no repeated ids.
+	:type runs: list of (array of tweet ids, array of times) tuples.
+	:return: (array of tweet ids, array of times) tuple. If a tweet id is in more than one run, its
+	time from the last of them is kept.
+	"""
+	runs = [run for run in runs if len(run[0])]
+	ids = array('l')
+	times = array('l')
+	if all(a[0][-1] < b[0][0] for a, b in zip(runs, runs[1:])):
+		for run_ids, run_times in runs:
+			ids.extend(run_ids)
+			times.extend(run_times)
+		return ids, times
+	for tid, _, ts in sorted((tid, n, ts) for n, (run_ids, run_times) in enumerate(runs)
+	                         for tid, ts in izip(run_ids, run_times)):
+		if ids and ids[-1] == tid:
+			times[-1] = ts
+		else:
+			ids.append(tid)
+			times.append(ts)
+	return ids, times
+
+
+class Postings(object):
+	def __init__(self, ids=None, times=None, time_sorted=None):
+		"""
+		A posting list: the ids of the tweets that used a hashtag, sorted, along with
+		the time each of those tweets was created.
+		Tweet ids grow over time, so the times are usually in order too, and time-range queries can
+		bisect them directly. Otherwise they use a copy of the list sorted by time (see time_index,
+		below), which is built the first time it's needed.
+		:param ids: tweet ids, in ascending order.
+		:type ids: array of integers.
+		:param times: the creation times of the tweets, parallel to ids.
+		:type times: array of integers.
+		:param time_sorted: whether the times are in ascending order. If None, they're checked.
+		:type time_sorted: boolean.
+		"""
+		self.ids = ids if ids is not None else array('l')
+		self.times = times if times is not None else array('l')
+		self.time_sorted = is_sorted(self.times) if time_sorted is None else time_sorted
+		self.pending = []
+		self.by_time = None
+
+	def add(self, tid, timestamp):
+		self.pending.append((tid, timestamp))
+
+	def flush(self):
+		"""
+		Merges pending postings into the sorted arrays, dropping duplicate tweet ids.
+		Postings newer than every one already in the list are appended; a few stragglers are
+		inserted in place; anything else is merged.
+		"""
+		if not self.pending:
+			return
+		ids, times = to_run(self.pending)
+		self.pending = []
+		if not self.ids or ids[0] > self.ids[-1]:
+			in_order = not (self.times and times[0] < self.times[-1]) and is_sorted(times)
+			if not self.time_sorted:
+				self.__extend_time_index__(ids, times)
+			self.time_sorted = self.time_sorted and in_order
+			self.ids.extend(ids)
+			self.times.extend(times)
+			return
+		if len(ids) <= INSERT_LIMIT:
+			for tid, ts in izip(ids, times):
+				i = bisect_left(self.ids, tid)
+				if i < len(self.ids) and self.ids[i] == tid:
+					self.times[i] = ts
+				else:
+					self.ids.insert(i, tid)
+					self.times.insert(i, ts)
+		else:
+			self.ids, self.times = merge_runs([(self.ids, self.times), (ids, times)])
+		self.time_sorted = False
+		self.by_time = None
+
+	def __extend_time_index__(self, ids, times):
+		if self.by_time is None:
+			return
+		index_times, index_ids = self.by_time
+		new = sorted(izip(times, ids))
+		if index_times and new[0][0] < index_times[-1]:
+			self.by_time = None
+			return
+		index_times.extend(ts for ts, _ in new)
+		index_ids.extend(tid for _, tid in new)
+
+	def time_index(self):
+		"""
+		:return: (array of times, array of tweet ids) tuple, sorted by time.
+		"""
+		self.flush()
+		if self.time_sorted:
+			return self.times, self.ids
+		if self.by_time is None:
+			pairs = sorted(izip(self.times, self.ids))
+			self.by_time = (array('l', (ts for ts, _ in pairs)), array('l', (tid for _, tid in pairs)))
+		return self.by_time
+
+	def __len__(self):
+		self.flush()
+		return len(self.ids)
+
+	def between(self, start=None, end=None):
+		"""
+		:param start: the earliest creation time, inclusive. If None, there is no lower bound.
+		:type start: integer.
+		:param end: the latest creation time, inclusive. If None, there is no upper bound.
+		:type end: integer.
+		:return: list of tweet ids.
+		"""
+		self.flush()
+		if start is None and end is None:
+			return list(self.ids)
+		times, ids = self.time_index()
+		i = bisect_left(times, start) if start is not None else 0
+		j = bisect_right(times, end) if end is not None else len(times)
+		if self.time_sorted:
+			return list(ids[i:j])
+		return sorted(ids[i:j])
+
+	def id_range(self, low=None, high=None):
+		"""
+		Tweet ids roughly track creation time, so an id range is a cheap stand-in for a
+		time range.
+		:param low: the lowest tweet id, inclusive.
+		:type low: integer.
+		:param high: the highest tweet id, inclusive.
+		:type high: integer.
+		:return: list of tweet ids.
+		"""
+		self.flush()
+		i = bisect_left(self.ids, low) if low is not None else 0
+		j = bisect_right(self.ids, high) if high is not None else len(self.ids)
+		return list(self.ids[i:j])
+
+
+class HashIndex(object):
+	def __init__(self, path=None, max_segments=64):
+		"""
+		An inverted index mapping interned hashtag ids to Postings objects, and tweet ids to the
+		hashtags they used.
+		The index can be built incrementally (see add_tweet and add_tweets, below), e.g. by
+		longitudinal or longitudinal_to_db, and saved to a directory containing:
+			tags.json: the header--the interned hashtags, where each one's postings are, where the
+			forward map is, and which postings file is current.
+			postings.<n>.bin: the tweet ids and times of every posting list, and the forward map, as
+			arrays of machine integers. Each save appends the postings added since the last one.
+		Posting lists and the forward map are only read from disk when a query needs them.
+		:param path: the directory the index is saved in. If it already holds an index,
+		that index will be loaded.
+		:type path: string.
+		:param max_segments: once the index has been saved this many times since it was last
+		compacted (see compact, below), the next save compacts it.
+		:type max_segments: integer.
+		"""
+		self.path = path
+		self.max_segments = max_segments
+		self.tags = []
+		self.tag_ids = {}
+		self.postings = {}
+		self.extents = {}
+		self.forward = []
+		self.forward_blocks = {}
+		self.new_postings = {}
+		self.new_forward = {}
+		self.filename = None
+		self.size = 0
+		if path and os.path.exists(os.path.join(path, 'tags.json')):
+			self.load()
+
+	def intern(self, tag):
+		"""
+		Returns the id of a hashtag, assigning it a new one if it hasn't been seen before.
+		:param tag: the hashtag.
+		:type tag: string.
+		:return: integer.
+		"""
+		tag = normalize_tag(tag)
+		try:
+			return self.tag_ids[tag]
+		except KeyError:
+			self.tag_ids[tag] = len(self.tags)
+			self.tags.append(tag)
+			return self.tag_ids[tag]
+
+	def get_postings(self, tag_id):
+		"""
+		:param tag_id: the id of a hashtag (see intern, above.)
+		:type tag_id: integer.
+		:return: Postings object, including any postings that haven't been saved yet.
+		"""
+		try:
+			return self.postings[tag_id]
+		except KeyError:
+			postings = Postings(*self.__read_postings__(tag_id))
+			for tid, ts in self.new_postings.get(tag_id, ()):
+				postings.add(tid, ts)
+			self.postings[tag_id] = postings
+			return postings
+
+	def __read_postings__(self, tag_id):
+		"""
+		:return: (array of tweet ids, array of times, whether the times are in order) tuple.
+		"""
+		runs = []
+		time_sorted = True
+		in_order = True
+		if self.extents.get(tag_id):
+			with open(os.path.join(self.path, self.filename), 'rb') as f:
+				for offset, length, run_sorted in self.extents[tag_id]:
+					ids = array('l')
+					times = array('l')
+					f.seek(offset)
+					ids.fromfile(f, length)
+					times.fromfile(f, length)
+					if runs:
+						in_order = in_order and runs[-1][0][-1] < ids[0]
+						time_sorted = time_sorted and runs[-1][1][-1] <= times[0]
+					time_sorted = time_sorted and run_sorted
+					runs.append((ids, times))
+		ids, times = runs[0] if len(runs) == 1 else merge_runs(runs)
+		return ids, times, time_sorted if in_order else None
+
+	def __read_forward__(self, block):
+		try:
+			return self.forward_blocks[block]
+		except KeyError:
+			offset, count, n_tags = block
+			ids = array('l')
+			starts = array('l')
+			tags = array('l')
+			with open(os.path.join(self.path, self.filename), 'rb') as f:
+				f.seek(offset)
+				ids.fromfile(f, count)
+				starts.fromfile(f, count + 1)
+				tags.fromfile(f, n_tags)
+			self.forward_blocks[block] = (ids, starts, tags)
+			return self.forward_blocks[block]
+
+	def tags_of(self, tid):
+		"""
+		:param tid: a tweet id.
+		:type tid: integer.
+		:return: list of the ids of the hashtags the tweet used (see intern, above.)
+		"""
+		if tid in self.new_forward:
+			return list(self.new_forward[tid])
+		for block in reversed(self.forward):
+			ids, starts, tags = self.__read_forward__(block)
+			i = bisect_left(ids, tid)
+			if i < len(ids) and ids[i] == tid:
+				return list(tags[starts[i]:starts[i + 1]])
+		return []
+
+	def add_tweet(self, tweet):
+		"""
+		Adds a tweet to the posting lists of each of its hashtags. Nothing is read from disk.
+		NB: tweets without metadata have no id, and are skipped.
+		:param tweet: the tweet to add.
+		:type tweet: ParsedTweet object.
+		"""
+		tid = tweet_id(tweet)
+		if tid is None:
+			return
+		timestamp = tweet_timestamp(tweet)
+		tag_ids = sorted(set(self.intern(tag) for tag in tweet.get_hashes() or []))
+		for tag_id in tag_ids:
+			self.new_postings.setdefault(tag_id, []).append((tid, timestamp))
+			if tag_id in self.postings:
+				self.postings[tag_id].add(tid, timestamp)
+		if tag_ids:
+			self.new_forward[tid] = tag_ids
+
+	def add_tweets(self, tweets):
+		for tweet in tweets:
+			self.add_tweet(tweet)
+
+	def tweets(self, tag, start=None, end=None):
+		"""
+		Which tweets used a hashtag between two times?
+		:param tag: the hashtag.
+		:type tag: string.
+		:param start: the earliest creation time (seconds since the epoch), inclusive.
+		:type start: integer.
+		:param end: the latest creation time, inclusive.
+		:type end: integer.
+		:return: list of tweet ids.
+		"""
+		tag_id = self.tag_ids.get(normalize_tag(tag))
+		if tag_id is None:
+			return []
+		return self.get_postings(tag_id).between(start, end)
+
+	def intersect(self, *tags, **kwargs):
+		"""
+		Which tweets used all of the given hashtags?
+		:param tags: the hashtags.
+		:type tags: strings.
+		:param start: (keyword only) the earliest creation time, inclusive.
+		:param end: (keyword only) the latest creation time, inclusive.
+		:return: list of tweet ids.
+		"""
+		start = kwargs.get('start')
+		end = kwargs.get('end')
+		lists = sorted((self.tweets(tag, start, end) for tag in tags), key=len)
+		if not lists:
+			return []
+		result = set(lists[0])
+		for l in lists[1:]:
+			result.intersection_update(l)
+			if not result:
+				break
+		return sorted(result)
+
+	def cooccurring(self, tag, start=None, end=None):
+		"""
+		Which hashtags were used alongside a hashtag, and how often?
+		Looks up the hashtags of each of the tag's tweets in the forward map, so it only reads the
+		one posting list.
+		:param tag: the hashtag.
+		:type tag: string.
+		:param start: the earliest creation time, inclusive.
+		:type start: integer.
+		:param end: the latest creation time, inclusive.
+		:type end: integer.
+		:return: dictionary of hashtag: count.
+		"""
+		tag_id = self.tag_ids.get(normalize_tag(tag))
+		counts = {}
+		if tag_id is None:
+			return counts
+		for tid in self.tweets(tag, start, end):
+			for other_id in self.tags_of(tid):
+				if other_id != tag_id:
+					other = self.tags[other_id]
+					counts[other] = counts.get(other, 0) + 1
+		return counts
+
+	def __path__(self, path=None):
+		path = path or self.path
+		if not path:
+			raise ValueError("HashIndex has no directory to save to; pass one as path to HashIndex or save")
+		return path
+
+	def load(self, path=None):
+		"""
+		Loads the header from disk. The posting lists and forward map themselves are read lazily
+		(see get_postings and tags_of, above.) Anything added since the last save is discarded.
+		:param path: the directory the index was saved in. Defaults to .path.
+		:type path: string.
+		:raises: ValueError if there's no path, i.e. neither path nor .path is given.
+		"""
+		self.path = self.__path__(path)
+		with open(os.path.join(self.path, 'tags.json')) as f:
+			header = json.load(f)
+		self.filename = header['file']
+		self.size = header['size']
+		self.tags = header['tags']
+		self.tag_ids = dict((tag, i) for i, tag in enumerate(self.tags))
+		self.extents = dict((int(k), [tuple(extent) for extent in v]) for k, v in header['extents'].items())
+		self.forward = [tuple(block) for block in header['forward']]
+		self.postings = {}
+		self.forward_blocks = {}
+		self.new_postings = {}
+		self.new_forward = {}
+
+	def save(self, path=None):
+		"""
+		Appends the postings added since the last save to the postings file, then replaces the
+		header. Saving to a new directory, or once there have been .max_segments saves since the
+		last compaction, compacts the index instead (see compact, below.)
+		:param path: the directory to save the index in. Defaults to .path.
+		:type path: string.
+		:raises: ValueError if there's no path, i.e. neither path nor .path is given.
+		"""
+		path = self.__path__(path)
+		if path != self.path or self.filename is None or len(self.forward) >= self.max_segments:
+			return self.compact(path)
+		if not self.new_forward:
+			return
+		extents = dict((tag_id, list(v)) for tag_id, v in self.extents.items())
+		with open(os.path.join(path, self.filename), 'r+b') as f:
+			f.seek(self.size)
+			f.truncate()
+			for tag_id in sorted(self.new_postings):
+				ids, times = to_run(self.new_postings[tag_id])
+				extents.setdefault(tag_id, []).append((f.tell(), len(ids), is_sorted(times)))
+				ids.tofile(f)
+				times.tofile(f)
+			forward = self.forward + [self.__write_forward__(f, sorted(self.new_forward.items()))]
+			size = f.tell()
+			f.flush()
+			os.fsync(f.fileno())
+		self.__write_header__(path, self.filename, size, extents, forward)
+		self.size = size
+		self.extents = extents
+		self.forward = forward
+		self.new_postings = {}
+		self.new_forward = {}
+
+	def compact(self, path=None):
+		"""
+		Rewrites the index as a new postings file, with each posting list in one piece and the
+		forward map in one block, replaces the header, and then removes the old postings file.
+		Posting lists are read one at a time; forward map blocks are merged as they're read.
+		:param path: the directory to save the index in. Defaults to .path.
+		:type path: string.
+		:raises: ValueError if there's no path, i.e. neither path nor .path is given.
+		"""
+		path = self.__path__(path)
+		if not os.path.exists(path):
+			os.makedirs(path)
+		generation = int(self.filename.split('.')[1]) + 1 if self.filename else 0
+		filename = 'postings.{}.bin'.format(generation)
+		extents = {}
+		with open(os.path.join(path, filename), 'wb') as f:
+			for tag_id in xrange(len(self.tags)):
+				cached = tag_id in self.postings
+				postings = self.get_postings(tag_id)
+				postings.flush()
+				if len(postings.ids):
+					extents[tag_id] = [(f.tell(), len(postings.ids), postings.time_sorted or is_sorted(postings.times))]
+					postings.ids.tofile(f)
+					postings.times.tofile(f)
+				if not cached:
+					del self.postings[tag_id]
+			blocks = [self.__forward_entries__(n, *self.__read_forward__(block))
+			          for n, block in enumerate(self.forward)]
+			blocks.append((tid, -len(self.forward), tags) for tid, tags in sorted(self.new_forward.items()))
+			forward = [self.__write_forward__(f, unique_entries(merge(*blocks)))]
+			size = f.tell()
+			f.flush()
+			os.fsync(f.fileno())
+		self.__write_header__(path, filename, size, extents, [block for block in forward if block])
+		if path == self.path and self.filename and self.filename != filename:
+			os.remove(os.path.join(path, self.filename))
+		self.path = path
+		self.filename = filename
+		self.size = size
+		self.extents = extents
+		self.forward = [block for block in forward if block]
+		self.forward_blocks = {}
+		self.new_postings = {}
+		self.new_forward = {}
+
+	@staticmethod
+	def __forward_entries__(n, ids, starts, tags):
+		for i in xrange(len(ids)):
+			yield ids[i], -n, tags[starts[i]:starts[i + 1]]
+
+	@staticmethod
+	def __write_forward__(f, entries):
+		"""
+		Writes a block of the forward map: the tweet ids, where each one's hashtags start, and the hashtags.
+		:param f: the postings file.
+		:param entries: (tweet id, hashtag ids) tuples, sorted by tweet id.
+		:return: (offset, number of tweets, number of hashtags) tuple, or None if there were no entries.
+		"""
+		ids = array('l')
+		starts = array('l', [0])
+		tags = array('l')
+		for tid, tag_ids in entries:
+			ids.append(tid)
+			tags.extend(tag_ids)
+			starts.append(len(tags))
+		if not ids:
+			return None
+		block = (f.tell(), len(ids), len(tags))
+		ids.tofile(f)
+		starts.tofile(f)
+		tags.tofile(f)
+		return block
+
+	def __write_header__(self, path, filename, size, extents, forward):
+		tmp = os.path.join(path, 'tags.json.tmp')
+		with open(tmp, 'w') as f:
+			json.dump({'file': filename, 'size': size, 'tags': self.tags, 'extents': extents, 'forward': forward}, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.rename(tmp, os.path.join(path, 'tags.json'))
+
+
+def unique_entries(entries):
+	"""
+	:param entries: (tweet id, -block number, hashtag ids) tuples from merged forward map blocks.
+	:return: (tweet id, hashtag ids) tuples, keeping only the entry from the latest block for each tweet.
+	"""
+	last = None
+	for tid, _, tags in entries:
+		if tid != last:
+			last = tid
+			yield tid, tags
@@ -0,0 +1,331 @@
+__author__ = 'samuelraker'
+
+import json
+import math
+import struct
+from array import array
+from hashlib import md5
+from hash_index import normalize_tag, tweet_timestamp
+
+
+###Bounded-memory sketches of hashtag frequency, for live stats while a stream runs.
+###Every sketch can be merged with another of the same shape (e.g. one from another
+###worker process) and serialized to/from JSON.
+
+
+def hash64(s):
+	"""
+	A 64-bit hash that, unlike the builtin hash, is the same in every process.
+	:param s: the string to hash.
+	:type s: string or unicode.
+	:return: tuple of two 32-bit integers (for double hashing) and the full 64-bit value.
+	"""
+	if isinstance(s, unicode):
+		s = s.encode('utf8')
+	h1, h2 = struct.unpack('<II', md5(s).digest()[:8])
+	return h1, h2, (h2 << 32) | h1
+
+
+class CountMinSketch(object):
+	def __init__(self, width=2048, depth=4, table=None):
+		"""
+		Approximate counts of hashtags in fixed memory. Estimates are never too low, and are
+		too high by at most (e/width) * the total count, with probability 1 - e^-depth.
+		:param width: the number of counters per row.
+		:type width: integer.
+		:param depth: the number of rows.
+		:type depth: integer.
+		:param table: the counters, if restoring a serialized sketch.
+		:type table: list of arrays.
+		"""
+		self.width = width
+		self.depth = depth
+		self.table = table or [array('L', [0] * width) for _ in xrange(depth)]
+		self.total = 0
+
+	def __cells__(self, key):
+		h1, h2, _ = hash64(key)
+		return [(h1 + i * h2) % self.width for i in xrange(self.depth)]
+
+	def add(self, key, count=1):
+		for row, cell in zip(self.table, self.__cells__(key)):
+			row[cell] += count
+		self.total += count
+
+	def estimate(self, key):
+		return min(row[cell] for row, cell in zip(self.table, self.__cells__(key)))
+
+	def merge(self, other):
+		"""
+		Adds another sketch's counts to this one's.
+		:param other: a sketch with the same width and depth.
+		:type other: CountMinSketch object.
+		"""
+		if (self.width, self.depth) != (other.width, other.depth):
+			raise ValueError("can't merge sketches of different sizes")
+		for row, other_row in zip(self.table, other.table):
+			for i in xrange(self.width):
+				row[i] += other_row[i]
+		self.total += other.total
+
+	def to_dict(self):
+		return {'width': self.width, 'depth': self.depth, 'total': self.total,
+		        'table': [row.tolist() for row in self.table]}
+
+	@classmethod
+	def from_dict(cls, d):
+		sketch = cls(d['width'], d['depth'], [array('L', row) for row in d['table']])
+		sketch.total = d['total']
+		return sketch
+
+
+class SpaceSaving(object):
+	def __init__(self, k=100):
+		"""
+		Tracks the (approximately) k most frequent hashtags in O(k) memory. Each tracked hashtag's
+		count may be too high by at most its error, and any hashtag that appears more than
+		total/k times is guaranteed to be tracked.
+		:param k: the number of hashtags to track.
+		:type k: integer.
+		"""
+		self.k = k
+		self.counts = {}
+		self.errors = {}
+		self.total = 0
+
+	def add(self, key, count=1):
+		self.total += count
+		if key in self.counts:
+			self.counts[key] += count
+		elif len(self.counts) < self.k:
+			self.counts[key] = count
+			self.errors[key] = 0
+		else:
+			smallest = min(self.counts, key=self.counts.get)
+			floor = self.counts.pop(smallest)
+			del self.errors[smallest]
+			self.counts[key] = floor + count
+			self.errors[key] = floor
+
+	def top(self, n=None):
+		"""
+		:param n: how many hashtags to return. If None, all tracked hashtags are returned.
+		:type n: integer.
+		:return: list of (hashtag, count, error) tuples, most frequent first.
+		"""
+		ranked = sorted(self.counts, key=self.counts.get, reverse=True)[:n or self.k]
+		return [(key, self.counts[key], self.errors[key]) for key in ranked]
+
+	def merge(self, other):
+		"""
+		Combines another summary with this one, keeping the k largest combined counts.
+		:param other: another summary.
+		:type other: SpaceSaving object.
+		"""
+		self_floor = min(self.counts.values()) if len(self.counts) >= self.k else 0
+		other_floor = min(other.counts.values()) if len(other.counts) >= other.k else 0
+		counts = {}
+		errors = {}
+		for key in set(self.counts) | set(other.counts):
+			counts[key] = self.counts.get(key, self_floor) + other.counts.get(key, other_floor)
+			errors[key] = self.errors.get(key, self_floor) + other.errors.get(key, other_floor)
+		kept = sorted(counts, key=counts.get, reverse=True)[:self.k]
+		self.counts = dict((key, counts[key]) for key in kept)
+		self.errors = dict((key, errors[key]) for key in kept)
+		self.total += other.total
+
+	def to_dict(self):
+		return {'k': self.k, 'total': self.total, 'counts': self.counts, 'errors': self.errors}
+
+	@classmethod
+	def from_dict(cls, d):
+		summary = cls(d['k'])
+		summary.counts = dict(d['counts'])
+		summary.errors = dict(d['errors'])
+		summary.total = d['total']
+		return summary
+
+
+class HyperLogLog(object):
+	def __init__(self, p=12, registers=None):
+		"""
+		Estimates the number of distinct hashtags seen in 2**p bytes, with a standard error
+		of about 1.04/sqrt(2**p) (1.6% for the default p.)
+		:param p: the number of hash bits used to pick a register.
+		:type p: integer.
+		:param registers: the registers, if restoring a serialized sketch.
+		:type registers: bytearray.
+		"""
+		self.p = p
+		self.m = 1 << p
+		self.registers = registers or bytearray(self.m)
+		if self.m >= 128:
+			self.alpha = 0.7213 / (1 + 1.079 / self.m)
+		else:
+			self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}[self.m]
+
+	def add(self, key):
+		x = hash64(key)[2]
+		j = x & (self.m - 1)
+		w = x >> self.p
+		rank = 64 - self.p - w.bit_length() + 1
+		if rank > self.registers[j]:
+			self.registers[j] = rank
+
+	def count(self):
+		estimate = self.alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+		if estimate <= 2.5 * self.m:
+			zeros = self.registers.count(b'\x00')
+			if zeros:
+				return int(round(self.m * math.log(float(self.m) / zeros)))
+		return int(round(estimate))
+
+	def merge(self, other):
+		if self.p != other.p:
+			raise ValueError("can't merge sketches of different precisions")
+		for i in xrange(self.m):
+			if other.registers[i] > self.registers[i]:
+				self.registers[i] = other.registers[i]
+
+	def to_dict(self):
+		return {'p': self.p, 'registers': list(self.registers)}
+
+	@classmethod
+	def from_dict(cls, d):
+		return cls(d['p'], bytearray(d['registers']))
+
+
+class HashtagStats(object):
+	def __init__(self, window=3600, max_windows=24, k=100, width=2048, depth=4, p=12):
+		"""
+		A streaming statistics stage for hashtags: overall frequencies (CountMinSketch), trending
+		hashtags (SpaceSaving), and distinct hashtag counts per time window (HyperLogLog).
+		Memory is bounded no matter how long the stream runs; only the most recent max_windows
+		windows are kept.
+		Pass one to Twitterizer.get_tweets or Twitterizer.tweet_iterator to update it as tweets arrive.
+		:param window: the length of each time window, in seconds.
+		:type window: integer.
+		:param max_windows: how many windows to keep distinct counts for.
+		:type max_windows: integer.
+		:param k: how many trending hashtags to track.
+		:type k: integer.
+		:param width: see CountMinSketch.
+		:type width: integer.
+		:param depth: see CountMinSketch.
+		:type depth: integer.
+		:param p: see HyperLogLog.
+		:type p: integer.
+		"""
+		self.window = window
+		self.max_windows = max_windows
+		self.p = p
+		self.frequencies = CountMinSketch(width, depth)
+		self.trending = SpaceSaving(k)
+		self.distinct = HyperLogLog(p)
+		self.windows = {}
+		self.tweets = 0
+
+	def __window__(self, timestamp):
+		start = timestamp - timestamp % self.window
+		try:
+			return self.windows[start]
+		except KeyError:
+			self.windows[start] = HyperLogLog(self.p)
+			while len(self.windows) > self.max_windows:
+				del self.windows[min(self.windows)]
+			return self.windows.get(start, HyperLogLog(self.p))
+
+	def add_tweet(self, tweet):
+		"""
+		:param tweet: the tweet whose hashtags will be counted.
+		:type tweet: ParsedTweet object.
+		"""
+		self.tweets += 1
+		tags = tweet.get_hashes()
+		if not tags:
+			return
+		window = self.__window__(tweet_timestamp(tweet))
+		for tag in tags:
+			tag = normalize_tag(tag)
+			self.frequencies.add(tag)
+			self.trending.add(tag)
+			self.distinct.add(tag)
+			window.add(tag)
+
+	def add_tweets(self, tweets):
+		for tweet in tweets:
+			self.add_tweet(tweet)
+
+	def count(self, tag):
+		"""
+		:return: integer, the (over)estimated number of times a hashtag has been used.
+		"""
+		return self.frequencies.estimate(normalize_tag(tag))
+
+	def top(self, n=10):
+		"""
+		:return: list of (hashtag, count, error) tuples. See SpaceSaving.top.
+		"""
+		return self.trending.top(n)
+
+	def distinct_count(self, timestamp=None):
+		"""
+		:param timestamp: a time in the window to count distinct hashtags for. If None,
+		the distinct count over the whole stream is returned.
+		:type timestamp: integer.
+		:return: integer.
+		"""
+		if timestamp is None:
+			return self.distinct.count()
+		hll = self.windows.get(timestamp - timestamp % self.window)
+		return hll.count() if hll else 0
+
+	def merge(self, other):
+		"""
+		Merges the stats from another HashtagStats object (e.g. one from another worker) into this one.
+		:param other: stats built with the same parameters.
+		:type other: HashtagStats object.
+		"""
+		self.frequencies.merge(other.frequencies)
+		self.trending.merge(other.trending)
+		self.distinct.merge(other.distinct)
+		for start, hll in other.windows.items():
+			if start in self.windows:
+				self.windows[start].merge(hll)
+			else:
+				self.windows[start] = HyperLogLog.from_dict(hll.to_dict())
+		while len(self.windows) > self.max_windows:
+			del self.windows[min(self.windows)]
+		self.tweets += other.tweets
+
+	def to_json(self):
+		"""
+		:return: string representation of the JSON serialization of the object.
+		"""
+		return json.dumps({
+			'window': self.window,
+			'max_windows': self.max_windows,
+			'p': self.p,
+			'tweets': self.tweets,
+			'frequencies': self.frequencies.to_dict(),
+			'trending': self.trending.to_dict(),
+			'distinct': self.distinct.to_dict(),
+			'windows': dict((str(start), hll.to_dict()) for start, hll in self.windows.items()),
+		})
+
+	@classmethod
+	def from_json(cls, s):
+		"""
+		The inverse of to_json, above.
+		:param s: JSON produced by to_json.
+		:type s: string.
+		:return: HashtagStats object.
+		"""
+		d = json.loads(s)
+		stats = cls(window=d['window'], max_windows=d['max_windows'], p=d['p'])
+		stats.tweets = d['tweets']
+		stats.frequencies = CountMinSketch.from_dict(d['frequencies'])
+		stats.trending = SpaceSaving.from_dict(d['trending'])
+		stats.distinct = HyperLogLog.from_dict(d['distinct'])
+		stats.windows = dict((int(start), HyperLogLog.from_dict(hll)) for start, hll in d['windows'].items())
+		return stats
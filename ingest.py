@@ -0,0 +1,474 @@
+__author__ = 'samuelraker'
+
+import os
+import threading
+import multiprocessing
+from Queue import Empty
+import get_tweets
+from get_tweets import parse_line
+from get_tweets import Twitterizer
+from get_tweets import Twitterator
+from get_tweets import atomic
+from get_tweets import next_pk
+from dedup import Deduplicator
+from instrument import METRICS
+from instrument import Progress
+from instrument import event
+
+
+###Loads tweets into the database with several worker processes.
+###A coordinator splits a JSON file (or the live stream) into shards; each worker parses, dedupes,
+###and bulk-writes its shard, taking primary keys from shared IdAllocators so that no two workers
+###ever use the same pk. Once every shard is written, the competitor pairs for the new hashtags are
+###made, again split between the workers. No broker is needed: workers talk to the coordinator
+###over multiprocessing queues.
+###NB: dedup is per worker, so duplicates that land in different shards are both written.
+###NB: SQLite only allows one writer at a time, so writes are serialized with a lock when the
+###database is SQLite; parsing and deduping still happen in parallel.
+
+
+#how often (in seconds) the coordinator checks that the workers it's waiting on are still alive.
+POLL_INTERVAL = 1
+
+
+class IdAllocator(object):
+	def __init__(self, start=1):
+		"""
+		Hands out primary keys to worker processes. Keys are allocated exactly as many at a time as
+		are about to be written, so (unless a write fails) there are no gaps between them--which
+		matters, because Twitterator.competitors_to_db stops at the first missing Hashtag pk.
+		:param start: the first pk to hand out.
+		:type start: integer.
+		"""
+		self.next = multiprocessing.Value('l', start)
+
+	def allocate(self, n):
+		"""
+		:param n: how many pks to allocate.
+		:type n: integer.
+		:return: integer, the first of n consecutive pks.
+		"""
+		with self.next.get_lock():
+			start = self.next.value
+			self.next.value += n
+		return start
+
+	def peek(self):
+		return self.next.value
+
+
+def close_connection():
+	"""
+	Closes this process's database connection, so that a forked child opens its own rather than
+	sharing the parent's.
+	"""
+	from django.db import connection
+	connection.close()
+
+
+class NullLock(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+def shard_file(infile, shards):
+	"""
+	Splits a file into byte ranges of roughly equal size, each starting and ending on a line boundary.
+	:param infile: the file to split.
+	:type infile: string.
+	:param shards: how many ranges to make.
+	:type shards: integer.
+	:return: list of (start, end) tuples of byte offsets.
+	"""
+	size = os.path.getsize(infile)
+	bounds = [0]
+	with open(infile, 'rb') as f:
+		for i in xrange(1, shards):
+			f.seek(max(bounds[-1], size * i // shards))
+			f.readline()
+			bounds.append(min(f.tell(), size))
+	bounds.append(size)
+	return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def read_shard(infile, start, end):
+	"""
+	A generator of ParsedTweet objects from the lines between two byte offsets of a JSON file
+	written by get_tweets.to_json (or of raw tweets.) Lines that don't hold a tweet are skipped
+	(see get_tweets.parse_line.)
+	"""
+	with open(infile, 'rb') as f:
+		f.seek(start)
+		while f.tell() < end:
+			line = f.readline()
+			if not line:
+				break
+			tweet = parse_line(line)
+			if tweet is None:
+				METRICS.incr('ingest.bad_lines')
+				continue
+			yield tweet
+
+
+def read_queue(queue):
+	"""
+	A generator of ParsedTweet objects made from the raw tweets a coordinator puts on a queue.
+	Stops when it gets None. Records that aren't tweets (see Twitterizer.is_tweet) are skipped.
+	"""
+	while True:
+		raw_tweet = queue.get()
+		if raw_tweet is None:
+			break
+		if not Twitterizer.is_tweet(raw_tweet):
+			METRICS.incr('filter.malformed')
+			continue
+		tweet = Twitterizer.parse_tweet(raw_tweet)
+		if tweet:
+			yield tweet
+
+
+class Worker(object):
+	def __init__(self, allocators, lock=None, batch_size=500, dedup=True):
+		"""
+		Parses, dedupes, and bulk-writes tweets in a worker process.
+		:param allocators: the IdAllocators for 'tweet', 'hashtag', and 'competitors' pks.
+		:type allocators: dictionary.
+		:param lock: held while writing, if writes need to be serialized.
+		:type lock: multiprocessing.Lock object.
+		:param batch_size: how many tweets (or competitor pairs) to write at once.
+		:type batch_size: integer.
+		:param dedup: whether to drop duplicate tweets (see dedup.Deduplicator.)
+		:type dedup: boolean.
+		"""
+		self.allocators = allocators
+		self.lock = lock or NullLock()
+		self.batch_size = batch_size
+		self.dedup = Deduplicator() if dedup else None
+		self.all_pks = None
+		self.tweets = 0
+		self.hashtags = 0
+		self.competitors = 0
+
+	def write_tweets(self, tweets):
+		"""
+		Writes a batch of tweets, their hashtags, and the links between them in one transaction.
+		:param tweets: the tweets to write.
+		:type tweets: list of ParsedTweet objects.
+		"""
+		get_tweets.load_django()
+		Tweet, Hashtag = get_tweets.Tweet, get_tweets.Hashtag
+		Link = Hashtag.tweet.through
+		n_tags = sum(len(tweet.get_hashes() or []) for tweet in tweets)
+		with self.lock:
+			tweet_pk = self.allocators['tweet'].allocate(len(tweets))
+			hash_pk = self.allocators['hashtag'].allocate(n_tags)
+			rows = []
+			hashtags = []
+			links = []
+			for tweet in tweets:
+				rows.append(Twitterator.make_tweet(tweet, tweet_pk))
+				for tag in tweet.get_hashes() or []:
+					hashtags.append(Hashtag(id=hash_pk, text=tag))
+					links.append(Link(hashtag_id=hash_pk, tweet_id=tweet_pk))
+					hash_pk += 1
+				tweet_pk += 1
+			with METRICS.timer('db.write'):
+				with atomic():
+					Tweet.objects.bulk_create(rows)
+					Hashtag.objects.bulk_create(hashtags)
+					Link.objects.bulk_create(links)
+		self.tweets += len(rows)
+		self.hashtags += len(hashtags)
+		METRICS.incr('db.tweets', len(rows))
+		METRICS.incr('db.hashtags', len(hashtags))
+
+	def ingest(self, tweets):
+		"""
+		:param tweets: the tweets to write.
+		:type tweets: iterable of ParsedTweet objects.
+		"""
+		if self.dedup is not None:
+			tweets = self.dedup.filter(tweets)
+		batch = []
+		for tweet in tweets:
+			batch.append(tweet)
+			if len(batch) >= self.batch_size:
+				self.write_tweets(batch)
+				batch = []
+		if batch:
+			self.write_tweets(batch)
+
+	def pair(self, tag2_pks):
+		"""
+		Writes the competitor pairs (tag1, tag2) for each tag2 in tag2_pks and every tag1 with a
+		smaller pk--the same pairs Twitterator.competitors_to_db would make--skipping pairs that
+		already exist.
+		NB: the pks of every hashtag are read once per worker, so pairing mustn't start until every
+		hashtag has been written.
+		:param tag2_pks: the pks of the hashtags to pair.
+		:type tag2_pks: list of integers.
+		"""
+		get_tweets.load_django()
+		Competitors = get_tweets.Competitors
+		if self.all_pks is None:
+			self.all_pks = list(get_tweets.Hashtag.objects.order_by('pk').values_list('pk', flat=True))
+		all_pks = self.all_pks
+		batch = []
+		for tag2 in tag2_pks:
+			with METRICS.timer('pairing'):
+				existing = set(Competitors.objects.filter(tag2__id=tag2).values_list('tag1_id', flat=True))
+			for tag1 in all_pks:
+				if tag1 >= tag2:
+					break
+				if tag1 not in existing:
+					batch.append((tag1, tag2))
+				if len(batch) >= self.batch_size:
+					self.write_pairs(batch)
+					batch = []
+		if batch:
+			self.write_pairs(batch)
+
+	def write_pairs(self, pairs):
+		Competitors = get_tweets.Competitors
+		with self.lock:
+			pk = self.allocators['competitors'].allocate(len(pairs))
+			rows = [Competitors(id=pk + i, tag1_id=tag1, tag2_id=tag2, yes=0, no=0)
+			        for i, (tag1, tag2) in enumerate(pairs)]
+			with METRICS.timer('db.write'):
+				with atomic():
+					Competitors.objects.bulk_create(rows)
+		self.competitors += len(rows)
+		METRICS.incr('db.competitors', len(rows))
+
+	def report(self):
+		return {
+			'pid': os.getpid(),
+			'tweets': self.tweets,
+			'hashtags': self.hashtags,
+			'competitors': self.competitors,
+			'duplicates': self.dedup.total_dropped() if self.dedup else 0,
+		}
+
+
+def run_worker(worker, tasks, results, source=None):
+	"""
+	The body of a worker process: runs tasks from the task queue until it gets None, then puts
+	a report (or the error that stopped it) on the results queue.
+	Tasks are ('file', infile, start, end), ('queue',) to read raw tweets from the source queue
+	until it gets None, or ('pair', tag2_pks).
+	"""
+	close_connection()
+	try:
+		while True:
+			task = tasks.get()
+			if task is None:
+				break
+			if task[0] == 'file':
+				worker.ingest(read_shard(*task[1:]))
+			elif task[0] == 'queue':
+				worker.ingest(read_queue(source))
+			elif task[0] == 'pair':
+				worker.pair(*task[1:])
+		results.put(worker.report())
+	except Exception as e:
+		results.put({'pid': os.getpid(), 'error': '{}: {}'.format(type(e).__name__, e)})
+	finally:
+		close_connection()
+
+
+class Coordinator(object):
+	def __init__(self, workers=None, batch_size=500, dedup=True, verbosity=True):
+		"""
+		Splits work between worker processes and collects their results.
+		:param workers: how many worker processes to use. Defaults to the number of CPUs.
+		:type workers: integer.
+		:param batch_size: how many tweets (or competitor pairs) each worker writes at once.
+		:type batch_size: integer.
+		:param dedup: whether workers drop duplicate tweets.
+		:type dedup: boolean.
+		:param verbosity: whether to log progress.
+		:type verbosity: boolean.
+		"""
+		get_tweets.load_django()
+		from django.db import connection
+		self.workers = workers or multiprocessing.cpu_count()
+		self.batch_size = batch_size
+		self.dedup = dedup
+		self.verbosity = verbosity
+		self.lock = multiprocessing.Lock() if connection.vendor == 'sqlite' else None
+		self.allocators = {
+			'tweet': IdAllocator(next_pk(get_tweets.Tweet)),
+			'hashtag': IdAllocator(next_pk(get_tweets.Hashtag)),
+			'competitors': IdAllocator(next_pk(get_tweets.Competitors)),
+		}
+		self.first_hashtag = self.allocators['hashtag'].peek()
+
+	def run(self, tasks, source=None, started=None):
+		"""
+		Starts the workers, hands them the tasks, and waits for them to finish.
+		If a worker dies without reporting (e.g. it's killed), the others are terminated--the dead
+		one may have been holding the write lock--and RuntimeError is raised.
+		:param tasks: the tasks (see run_worker, above.)
+		:type tasks: list of tuples.
+		:param source: a queue of raw tweets, for ('queue',) tasks.
+		:type source: multiprocessing.Queue object.
+		:param started: called once every worker has been started, e.g. to start feeding source.
+		NB: no threads should be started in this process before then, since forking while another
+		thread holds a lock (the logging module's, say) can leave it held forever in the child.
+		:type started: function.
+		:return: list of the workers' reports.
+		"""
+		queue = multiprocessing.Queue()
+		results = multiprocessing.Queue()
+		close_connection()
+		processes = []
+		for _ in xrange(self.workers):
+			worker = Worker(self.allocators, self.lock, self.batch_size, self.dedup)
+			p = multiprocessing.Process(target=run_worker, args=(worker, queue, results, source))
+			p.start()
+			processes.append(p)
+		for task in tasks:
+			queue.put(task)
+		for _ in xrange(self.workers):
+			queue.put(None)
+		if started is not None:
+			started()
+		reports = self.collect(processes, results)
+		for p in processes:
+			p.join()
+		errors = [r['error'] for r in reports if 'error' in r]
+		if errors:
+			raise RuntimeError("{} worker(s) failed: {}".format(len(errors), '; '.join(errors)))
+		return reports
+
+	def collect(self, processes, results):
+		"""
+		Waits for a report from each worker, checking every POLL_INTERVAL seconds for workers that
+		have exited without one.
+		:param processes: the workers.
+		:type processes: list of multiprocessing.Process objects.
+		:param results: the queue the workers report on.
+		:type results: multiprocessing.Queue object.
+		:return: list of the workers' reports, in the same order as processes.
+		"""
+		reports = {}
+		while len(reports) < len(processes):
+			try:
+				report = results.get(timeout=POLL_INTERVAL)
+				reports[report['pid']] = report
+				continue
+			except Empty:
+				dead = [p for p in processes if p.pid not in reports and not p.is_alive()]
+			if not dead:
+				continue
+			# a worker that reported just before exiting may not have been read yet.
+			while True:
+				try:
+					report = results.get(timeout=0.1)
+					reports[report['pid']] = report
+				except Empty:
+					break
+			lost = [p for p in dead if p.pid not in reports]
+			for p in lost:
+				reports[p.pid] = {'pid': p.pid, 'error': 'worker exited with code {} without reporting'.format(
+					p.exitcode)}
+			if lost:
+				for p in processes:
+					if p.pid not in reports:
+						p.terminate()
+						reports[p.pid] = {'pid': p.pid, 'error': 'terminated after another worker died'}
+		return [reports[p.pid] for p in processes]
+
+	def pair_new_hashtags(self):
+		"""
+		The merge step: once every shard is written, makes the competitor pairs for the hashtags
+		added since the coordinator started, split between the workers.
+		:return: list of the workers' reports.
+		"""
+		all_pks = list(get_tweets.Hashtag.objects.order_by('pk').values_list('pk', flat=True))
+		new_pks = [pk for pk in all_pks if pk >= self.first_hashtag]
+		chunk = max(1, len(new_pks) // (self.workers * 4))
+		tasks = [('pair', new_pks[i:i + chunk]) for i in xrange(0, len(new_pks), chunk)]
+		return self.run(tasks)
+
+	def summarize(self, stage, reports):
+		if self.verbosity:
+			totals = {}
+			for report in reports:
+				for k in ('tweets', 'hashtags', 'competitors', 'duplicates'):
+					totals[k] = totals.get(k, 0) + report[k]
+			event('ingest', stage=stage, workers=self.workers, **totals)
+
+
+def sharded_json_to_db(infile, workers=None, batch_size=500, dedup=True, pair=True, verbosity=True):
+	"""
+	The parallel equivalent of get_tweets.json_to_db: splits a JSON file into shards, loads them with
+	several worker processes, and then makes the competitor pairs for the new hashtags.
+	:param infile: the path to the JSON file.
+	:type infile: string.
+	:param workers: how many worker processes to use. Defaults to the number of CPUs.
+	:type workers: integer.
+	:param batch_size: how many tweets (or pairs) each worker writes at once.
+	:type batch_size: integer.
+	:param dedup: whether workers drop duplicate tweets.
+	:type dedup: boolean.
+	:param pair: whether to make competitor pairs once the tweets are loaded.
+	:type pair: boolean.
+	:param verbosity: whether to log progress.
+	:type verbosity: boolean.
+	:return: Coordinator object.
+	"""
+	coordinator = Coordinator(workers, batch_size, dedup, verbosity)
+	shards = shard_file(infile, coordinator.workers * 4)
+	coordinator.summarize('tweets', coordinator.run([('file', infile, start, end) for start, end in shards]))
+	if pair:
+		coordinator.summarize('competitors', coordinator.pair_new_hashtags())
+	return coordinator
+
+
+def sharded_stream_to_db(sample, limit=1000, workers=None, batch_size=500, dedup=True, pair=True,
+                         verbosity=True):
+	"""
+	Reads raw tweets from a stream in this process (in a thread, started once the workers have
+	been forked) and hands them to worker processes to parse, dedupe, and write.
+	:param sample: a twitter.stream.statuses.sample object, or anything else with a next method
+	that returns raw tweet dictionaries.
+	:param limit: the number of raw tweets to read.
+	:type limit: integer.
+	See sharded_json_to_db, above, for the other parameters.
+	:return: Coordinator object.
+	"""
+	coordinator = Coordinator(workers, batch_size, dedup, verbosity)
+	raw_tweets = multiprocessing.Queue(maxsize=batch_size * coordinator.workers * 2)
+	feeder = threading.Thread(target=feed_queue, args=(sample, raw_tweets, limit, coordinator.workers, verbosity))
+	feeder.daemon = True
+	reports = coordinator.run([('queue',)] * coordinator.workers, raw_tweets, started=feeder.start)
+	feeder.join()
+	coordinator.summarize('tweets', reports)
+	if pair:
+		coordinator.summarize('competitors', coordinator.pair_new_hashtags())
+	return coordinator
+
+
+def feed_queue(sample, queue, limit, workers, verbosity=True):
+	"""
+	Puts up to limit raw tweets from a sample on a queue, followed by one None per worker.
+	NB: None from the sample itself is dropped, so that it isn't taken for the end of the queue.
+	"""
+	progress = Progress('stream', enabled=verbosity)
+	try:
+		for _ in xrange(limit):
+			try:
+				raw_tweet = sample.next()
+			except StopIteration:
+				break
+			if raw_tweet is not None:
+				queue.put(raw_tweet)
+			progress.update()
+	finally:
+		for _ in xrange(workers):
+			queue.put(None)
+		progress.done()
@@ -0,0 +1,237 @@
+__author__ = 'samuelraker'
+
+import json
+import math
+import time
+import logging
+
+
+###Counters, timers, and histograms for the stages of the capture and load pipeline
+###(stream.read, filter, parse, tokenize, db.write, pairing), plus rate-limited progress messages.
+###Metrics are off by default, and cost almost nothing until they're turned on with METRICS.enable().
+
+
+log = logging.getLogger('hash_out')
+if not log.handlers:
+	handler = logging.StreamHandler()
+	handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+	log.addHandler(handler)
+	log.setLevel(logging.INFO)
+
+
+def format_fields(fields):
+	"""
+	:param fields: the fields to format.
+	:type fields: dictionary.
+	:return: string of space-separated key=value pairs, sorted by key.
+	"""
+	return ' '.join('{}={}'.format(k, fields[k]) for k in sorted(fields))
+
+
+class NullTimer(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer(object):
+	def __init__(self, metrics, name):
+		self.metrics = metrics
+		self.name = name
+		self.start = None
+
+	def __enter__(self):
+		self.start = time.time()
+		return self
+
+	def __exit__(self, *exc):
+		self.metrics.observe(self.name, (time.time() - self.start) * 1000)
+		return False
+
+
+class Histogram(object):
+	def __init__(self):
+		"""
+		Counts values in power-of-two buckets (each keyed by the upper bound of the values in it),
+		along with their count, sum, min, and max.
+		"""
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+		self.buckets = {}
+
+	def add(self, value):
+		self.count += 1
+		self.total += value
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+		bucket = 2.0 ** math.ceil(math.log(value, 2)) if value > 0 else 0.0
+		self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+	def to_dict(self):
+		return {
+			'count': self.count,
+			'sum': self.total,
+			'mean': self.total / self.count if self.count else None,
+			'min': self.min,
+			'max': self.max,
+			'buckets': dict(('{:g}'.format(k), v) for k, v in self.buckets.items()),
+		}
+
+
+class Metrics(object):
+	def __init__(self, enabled=False, outfile=None, interval=60):
+		"""
+		A registry of counters and histograms. When disabled (the default), incr and observe return
+		immediately and timer returns a shared no-op context manager.
+		Timers record milliseconds into the histogram of the same name.
+		:param enabled: whether to record anything.
+		:type enabled: boolean.
+		:param outfile: the file to append snapshots to (one line of JSON each.) If None, snapshots
+		are logged instead.
+		:type outfile: string.
+		:param interval: the minimum number of seconds between snapshots written by tick, below.
+		:type interval: integer.
+		"""
+		self.enabled = enabled
+		self.outfile = outfile
+		self.interval = interval
+		self.counters = {}
+		self.histograms = {}
+		self.started = time.time()
+		self.last_export = self.started
+
+	def enable(self, outfile=None, interval=60):
+		self.enabled = True
+		self.outfile = outfile
+		self.interval = interval
+
+	def disable(self):
+		self.enabled = False
+
+	def reset(self):
+		self.counters = {}
+		self.histograms = {}
+		self.started = time.time()
+		self.last_export = self.started
+
+	def incr(self, name, n=1):
+		if not self.enabled:
+			return
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def observe(self, name, value):
+		if not self.enabled:
+			return
+		try:
+			self.histograms[name].add(value)
+		except KeyError:
+			self.histograms[name] = Histogram()
+			self.histograms[name].add(value)
+
+	def timer(self, name):
+		"""
+		Usage: with METRICS.timer('parse'): ...
+		:param name: the name of the stage being timed.
+		:type name: string.
+		:return: a context manager.
+		"""
+		if not self.enabled:
+			return NULL_TIMER
+		return Timer(self, name)
+
+	def snapshot(self):
+		"""
+		:return: dictionary of the current counters and histograms.
+		"""
+		now = time.time()
+		return {
+			'time': now,
+			'elapsed': now - self.started,
+			'counters': dict(self.counters),
+			'histograms': dict((name, h.to_dict()) for name, h in self.histograms.items()),
+		}
+
+	def export(self, outfile=None):
+		"""
+		Appends a snapshot to outfile (or .outfile), or logs it if there's no file to write to.
+		:param outfile: the file to append the snapshot to.
+		:type outfile: string.
+		"""
+		outfile = outfile or self.outfile
+		snapshot = json.dumps(self.snapshot(), sort_keys=True)
+		if outfile:
+			with open(outfile, 'a') as f:
+				f.write(snapshot + '\n')
+		else:
+			log.info('metrics %s', snapshot)
+		self.last_export = time.time()
+
+	def tick(self):
+		"""
+		Exports a snapshot if metrics are enabled and at least .interval seconds have passed since
+		the last one. Meant to be called at batch boundaries.
+		"""
+		if self.enabled and time.time() - self.last_export >= self.interval:
+			self.export()
+
+
+METRICS = Metrics()
+
+
+class Progress(object):
+	def __init__(self, name, interval=5, enabled=True):
+		"""
+		Rate-limited progress messages: at most one every interval seconds, however often update is called.
+		:param name: what's being done, e.g. "tweets_to_db".
+		:type name: string.
+		:param interval: the minimum number of seconds between messages.
+		:type interval: integer.
+		:param enabled: whether to log anything at all.
+		:type enabled: boolean.
+		"""
+		self.name = name
+		self.interval = interval
+		self.enabled = enabled
+		self.count = 0
+		self.started = time.time()
+		self.last = self.started
+
+	def update(self, n=1, **fields):
+		"""
+		:param n: how many more items have been processed.
+		:type n: integer.
+		:param fields: anything else to include in the message.
+		"""
+		self.count += n
+		if self.enabled:
+			now = time.time()
+			if now - self.last >= self.interval:
+				self.last = now
+				self.log(now, fields)
+
+	def done(self, **fields):
+		if self.enabled:
+			fields['done'] = True
+			self.log(time.time(), fields)
+
+	def log(self, now, fields):
+		elapsed = now - self.started
+		fields['count'] = self.count
+		fields['rate'] = '{:.1f}/s'.format(self.count / elapsed if elapsed else 0.0)
+		log.info('%s %s', self.name, format_fields(fields))
+
+
+def event(name, **fields):
+	"""
+	Logs a one-off structured message, e.g. event('longitudinal', state='sleeping', seconds=3600).
+	"""
+	log.info('%s %s', name, format_fields(fields))
@@ -0,0 +1,140 @@
+__author__ = 'samuelraker'
+
+
+###An in-memory record of which hashtag pairs already have a Competitors row, so that
+###Twitterator.__save_comps__ doesn't have to query the database for every candidate pair.
+###Recently seen pairs are held exactly; every pair ever seen also goes into a Bloom filter, so
+###that once the exact pairs start being evicted, a pair that was never seen still doesn't need a query.
+
+
+class BloomFilter(object):
+	def __init__(self, bits, hashes=7):
+		"""
+		A fixed-size set that can say an item is definitely absent, or probably present.
+		:param bits: the size of the filter. Rounded up to a multiple of 8.
+		:type bits: integer.
+		:param hashes: how many bits each item sets.
+		:type hashes: integer.
+		"""
+		self.bits = max(8, (bits + 7) // 8 * 8)
+		self.hashes = hashes
+		self.array = bytearray(self.bits // 8)
+		self.count = 0
+
+	def positions(self, item):
+		"""
+		:return: list of the bit positions for an item (by double hashing.)
+		"""
+		h1 = hash(item)
+		h2 = hash((item, 0x9e3779b9)) | 1
+		bits = self.bits
+		return [(h1 + i * h2) % bits for i in xrange(self.hashes)]
+
+	def add(self, item):
+		array = self.array
+		for pos in self.positions(item):
+			array[pos >> 3] |= 1 << (pos & 7)
+		self.count += 1
+
+	def __contains__(self, item):
+		array = self.array
+		for pos in self.positions(item):
+			if not array[pos >> 3] & (1 << (pos & 7)):
+				return False
+		return True
+
+
+class PairCache(object):
+	def __init__(self, max_size=1000000, bloom_bits=None):
+		"""
+		A bounded set of hashtag pk pairs. (a, b) and (b, a) are the same pair.
+		Pairs are held in two generations: new pairs (and pairs found in the old generation) go into
+		the new one, and when it holds max_size / 2 pairs, the old generation is dropped and the new
+		one takes its place--so a hit costs a set lookup rather than reordering anything, and the
+		pairs that are dropped are the ones that haven't been seen for longest.
+		Once the cache has been warmed from the whole table (see warm, below), a miss means the pair
+		doesn't exist if nothing has been dropped yet, or if it isn't in the Bloom filter of every
+		pair added. Otherwise a miss falls back to a lookup function.
+		:param max_size: the maximum number of pairs held exactly.
+		:type max_size: integer.
+		:param bloom_bits: the size of the Bloom filter. Defaults to 16 bits per pair held exactly,
+		which keeps false positives under 1% until the filter has seen twice max_size pairs.
+		:type bloom_bits: integer.
+		"""
+		self.max_size = max_size
+		self.generation_size = max(1, max_size // 2)
+		self.pairs = set()
+		self.old = set()
+		self.bloom = BloomFilter(bloom_bits or 16 * max_size)
+		self.complete = False
+		self.warmed = False
+		self.hits = 0
+		self.misses = 0
+		self.filtered = 0
+		self.lookups = 0
+
+	@staticmethod
+	def key(a, b):
+		return (a, b) if a <= b else (b, a)
+
+	def warm(self, pairs):
+		"""
+		Loads pairs in bulk, e.g. Competitors.objects.values_list('tag1_id', 'tag2_id').iterator().
+		:param pairs: every existing pair.
+		:type pairs: iterable of (integer, integer) tuples.
+		"""
+		self.complete = True
+		for a, b in pairs:
+			self.add(a, b)
+		self.warmed = True
+
+	def add(self, a, b):
+		"""
+		Records that a pair exists.
+		"""
+		key = self.key(a, b)
+		if key not in self.pairs and key not in self.old:
+			self.bloom.add(key)
+		self.__hold__(key)
+
+	def __hold__(self, key):
+		self.old.discard(key)
+		self.pairs.add(key)
+		if len(self.pairs) >= self.generation_size:
+			if self.old:
+				self.complete = False
+			self.old = self.pairs
+			self.pairs = set()
+
+	def exists(self, a, b, lookup=None):
+		"""
+		:param a: the pk of one hashtag.
+		:type a: integer.
+		:param b: the pk of the other.
+		:type b: integer.
+		:param lookup: called as lookup(a, b) to check the database when the cache can't tell.
+		:type lookup: function.
+		:return: boolean, whether the pair exists.
+		"""
+		key = self.key(a, b)
+		if key in self.pairs:
+			self.hits += 1
+			return True
+		if key in self.old:
+			self.hits += 1
+			self.__hold__(key)
+			return True
+		self.misses += 1
+		if self.complete or lookup is None:
+			return False
+		if self.warmed and key not in self.bloom:
+			self.filtered += 1
+			return False
+		self.lookups += 1
+		found = bool(lookup(a, b))
+		if found:
+			self.add(a, b)
+		return found
+
+	def __len__(self):
+		return len(self.pairs) + len(self.old)
@@ -0,0 +1,262 @@
+__author__ = 'samuelraker'
+
+import bz2
+import sys
+import gzip
+import json
+import time
+import random
+from itertools import islice
+
+
+###Replays captured tweets in place of the Streaming API, for offline load testing.
+###ReplayStream stands in for twitter.TwitterStream: pass one to Twitterizer (or to longitudinal /
+###longitudinal_to_db as stream=) and everything downstream runs as though it were live.
+###Usage: python replay.py capture.json [limit] [rate] to measure the maximum sustained ingest rate.
+
+
+def open_capture(path):
+	"""
+	Opens a capture file, decompressing it if its name ends in .gz or .bz2.
+	:param path: the capture file.
+	:type path: string.
+	:return: file object.
+	"""
+	if path.endswith('.gz'):
+		return gzip.open(path, 'rb')
+	if path.endswith('.bz2'):
+		return bz2.BZ2File(path, 'rb')
+	return open(path, 'rb')
+
+
+def to_raw(record):
+	"""
+	Turns a line of a capture back into a raw tweet. Captures written by get_tweets.to_json hold
+	[text, metadata] lists; raw captures of the stream hold the tweet dictionaries themselves.
+	:param record: a decoded line of a capture.
+	:type record: list or dictionary.
+	:return: dictionary.
+	"""
+	if isinstance(record, list):
+		raw = dict(record[1] or {})
+		raw['text'] = record[0]
+		return raw
+	return record
+
+
+class ReplaySource(object):
+	def __init__(self, paths, loop=False, preload=False):
+		"""
+		Reads raw tweets from one or more capture files, one line at a time.
+		:param paths: the capture files (JSON, one tweet per line, optionally gzip- or bzip2-compressed.)
+		:type paths: string or list of strings.
+		:param loop: whether to start again from the first file once the last one runs out (unless
+		nothing could be read from them.)
+		:type loop: boolean.
+		:param preload: whether to read every line into memory first, so that replaying doesn't
+		touch the disk. NB: lines are kept as strings and only decoded as they're replayed.
+		:type preload: boolean.
+		"""
+		self.paths = [paths] if isinstance(paths, basestring) else list(paths)
+		self.loop = loop
+		self.lines = None
+		if preload:
+			self.lines = []
+			for path in self.paths:
+				with open_capture(path) as f:
+					self.lines.extend(line for line in f if line.strip())
+		self.reader = self.__read__()
+
+	def __read__(self):
+		while True:
+			records = 0
+			for line in self.__lines__():
+				try:
+					record = to_raw(json.loads(line))
+				except (ValueError, IndexError, TypeError):
+					continue
+				records += 1
+				yield record
+			if not (self.loop and records):
+				break
+
+	def __lines__(self):
+		if self.lines is not None:
+			for line in self.lines:
+				yield line
+		else:
+			for path in self.paths:
+				with open_capture(path) as f:
+					for line in f:
+						if line.strip():
+							yield line
+
+	def next(self):
+		"""
+		:return: dictionary, the next raw tweet. Lines that aren't JSON are skipped.
+		:raises: StopIteration once the captures run out--if loop is True, once a whole pass through
+		them turns up nothing to replay (e.g. the captures are empty.)
+		"""
+		return self.reader.next()
+
+
+class ReplaySample(object):
+	def __init__(self, stream):
+		"""
+		Stands in for twitter.stream.statuses.sample: an iterator of raw tweets from a ReplayStream.
+		Get one from ReplayStream.statuses.sample() rather than making one directly.
+		"""
+		self.stream = stream
+		self.connected = True
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		if not self.connected:
+			raise StopIteration
+		return self.stream.emit(self)
+
+
+class ReplayStream(object):
+	def __init__(self, source, rate=None, malformed=0.0, disconnect_every=None, seed=0):
+		"""
+		Stands in for twitter.TwitterStream, replaying captured tweets at a set rate.
+		Every sample from the stream shares its position in the captures, so a new sample taken
+		after a disconnect carries on where the last one stopped--as reconnecting to the API would.
+		:param source: where the tweets come from.
+		:type source: ReplaySource object, or the path(s) to pass to one.
+		:param rate: the maximum number of records per second. If None, records are emitted as fast as
+		they're asked for.
+		:type rate: float.
+		:param malformed: the fraction of records to replace with something that isn't a well-formed
+		tweet (delete and limit notices, tweets missing entities or user, and None.)
+		:type malformed: float.
+		:param disconnect_every: if given, each sample is disconnected (i.e. raises StopIteration) after
+		this many records.
+		:type disconnect_every: integer.
+		:param seed: the seed for choosing which records are malformed.
+		:type seed: integer.
+		"""
+		self.source = source if isinstance(source, ReplaySource) else ReplaySource(source)
+		self.rate = rate
+		self.malformed = malformed
+		self.disconnect_every = disconnect_every
+		self.rng = random.Random(seed)
+		self.statuses = self
+		self.emitted = 0
+		self.injected = 0
+		self.disconnects = 0
+		self.since_connect = 0
+		self.started = None
+
+	def sample(self, **kwargs):
+		"""
+		:return: ReplaySample object.
+		"""
+		self.since_connect = 0
+		return ReplaySample(self)
+
+	def emit(self, sample):
+		"""
+		Returns the next record for a sample, waiting if need be to keep to .rate.
+		"""
+		if self.disconnect_every and self.since_connect >= self.disconnect_every:
+			sample.connected = False
+			self.disconnects += 1
+			raise StopIteration
+		if self.started is None:
+			self.started = time.time()
+		if self.rate:
+			wait = self.started + self.emitted / float(self.rate) - time.time()
+			if wait > 0:
+				time.sleep(wait)
+		raw = self.source.next()
+		if self.malformed and self.rng.random() < self.malformed:
+			raw = self.corrupt(raw)
+			self.injected += 1
+		self.emitted += 1
+		self.since_connect += 1
+		return raw
+
+	def corrupt(self, raw):
+		"""
+		:param raw: a raw tweet.
+		:type raw: dictionary.
+		:return: a record that isn't a well-formed tweet.
+		"""
+		kind = self.rng.randint(0, 4)
+		if kind == 0:
+			return {'delete': {'status': {'id': raw.get('id'), 'user_id': (raw.get('user') or {}).get('id')}}}
+		if kind == 1:
+			return {'limit': {'track': self.rng.randint(1, 1000)}}
+		if kind == 2:
+			broken = dict(raw)
+			broken.pop('entities', None)
+			return broken
+		if kind == 3:
+			broken = dict(raw)
+			broken['user'] = None
+			return broken
+		return None
+
+	def report(self):
+		"""
+		:return: dictionary of how many records were emitted, how many of those were malformed, how
+		many disconnects there were, and the rate records were emitted at.
+		"""
+		elapsed = time.time() - self.started if self.started else 0.0
+		return {
+			'emitted': self.emitted,
+			'malformed': self.injected,
+			'disconnects': self.disconnects,
+			'seconds': elapsed,
+			'rate': self.emitted / elapsed if elapsed else 0.0,
+		}
+
+
+def measure(paths, limit=100000, rate=None, malformed=0.0, disconnect_every=None, **kwargs):
+	"""
+	Runs captured tweets through Twitterizer.tweet_iterator (reconnecting after each disconnect,
+	as the longitudinal loops do) and reports the sustained rate.
+	:param paths: the capture file(s).
+	:type paths: string or list of strings.
+	:param limit: the number of tweets to parse.
+	:type limit: integer.
+	:param kwargs: passed to Twitterizer.tweet_iterator, e.g. dedup or stats.
+	See ReplayStream, above, for the other parameters.
+	:return: dictionary (see ReplayStream.report.)
+	"""
+	from get_tweets import Twitterizer
+	stream = ReplayStream(ReplaySource(paths, loop=True, preload=True), rate, malformed, disconnect_every)
+	t = Twitterizer(stream=stream)
+	#samples are read a pass through the captures at a time, so that if a whole pass turns up no
+	#tweets (e.g. every one is filtered out), measuring stops rather than spinning.
+	window = len(stream.source.lines)
+	sample = stream.statuses.sample()
+	parsed = 0
+	fruitless = 0
+	while parsed < limit:
+		if not sample.connected:
+			sample = stream.statuses.sample()
+		before = parsed
+		emitted = stream.emitted
+		for _ in t.tweet_iterator(islice(sample, window), limit=limit - parsed, **kwargs):
+			parsed += 1
+		if parsed > before:
+			fruitless = 0
+			continue
+		fruitless += stream.emitted - emitted
+		if fruitless >= window or (sample.connected and stream.emitted == emitted):
+			break
+	report = stream.report()
+	report['parsed'] = parsed
+	report['parsed_rate'] = parsed / report['seconds'] if report['seconds'] else 0.0
+	return report
+
+
+if __name__ == "__main__":
+	result = measure(sys.argv[1],
+	                 int(sys.argv[2]) if len(sys.argv) > 2 else 100000,
+	                 float(sys.argv[3]) if len(sys.argv) > 3 else None)
+	print json.dumps(result, sort_keys=True)
@@ -0,0 +1,4 @@
+__author__ = 'samuelraker'
+
+
+###Run from the top of the repo with: python -m unittest discover -s tests -t .
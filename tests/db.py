@@ -0,0 +1,50 @@
+__author__ = 'samuelraker'
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+import unittest
+
+
+###Points Django at a throwaway SQLite database (a file, so that ingest's worker processes can share
+###it) with the tables of tests/hash_to_hash. Database tests call setup_django in setUpClass, and
+###are skipped if Django isn't installed.
+
+
+_DB_DIR = None
+
+
+def setup_django():
+	global _DB_DIR
+	try:
+		import django
+		from django.conf import settings
+		from django.core.management import call_command
+	except ImportError:
+		raise unittest.SkipTest("django is not installed")
+	if _DB_DIR is None:
+		sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+		_DB_DIR = tempfile.mkdtemp(prefix='hash_out_test_db')
+		atexit.register(shutil.rmtree, _DB_DIR, True)
+		settings.configure(
+			DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+			                       'NAME': os.path.join(_DB_DIR, 'test.sqlite3')}},
+			INSTALLED_APPS=['hash_to_hash'])
+		django.setup()
+		call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+	import get_tweets
+	get_tweets.load_django()
+	return get_tweets
+
+
+def clear_tables():
+	import get_tweets
+	get_tweets.Competitors.objects.all().delete()
+	get_tweets.Hashtag.objects.all().delete()
+	get_tweets.Tweet.objects.all().delete()
+
+
+def pks(model):
+	return list(model.objects.order_by('pk').values_list('pk', flat=True))
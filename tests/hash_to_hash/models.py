@@ -0,0 +1,28 @@
+__author__ = 'samuelraker'
+
+from django.db import models
+
+
+###A stand-in for the hash_to_hash app's models, with just the fields get_tweets and ingest use,
+###so the database code can be tested against SQLite.
+
+
+class Tweet(models.Model):
+	text = models.TextField()
+	munged_text = models.TextField()
+	uid = models.BigIntegerField(null=True)
+	time_zone = models.CharField(max_length=100, null=True)
+	lat = models.FloatField(null=True)
+	lon = models.FloatField(null=True)
+
+
+class Hashtag(models.Model):
+	text = models.CharField(max_length=140)
+	tweet = models.ManyToManyField(Tweet)
+
+
+class Competitors(models.Model):
+	tag1 = models.ForeignKey(Hashtag, related_name='competitors1', on_delete=models.CASCADE)
+	tag2 = models.ForeignKey(Hashtag, related_name='competitors2', on_delete=models.CASCADE)
+	yes = models.IntegerField(default=0)
+	no = models.IntegerField(default=0)
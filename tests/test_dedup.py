@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+__author__ = 'samuelraker'
+
+import json
+import unittest
+from dedup import Deduplicator
+from get_tweets import ParsedTweet
+
+
+def make_tweet(tid, text, **metadata):
+	metadata.update({'id': tid, 'user': {'id': 1}, 'timestamp_ms': '1400000000000'})
+	return ParsedTweet(text, metadata)
+
+
+class DeduplicatorTest(unittest.TestCase):
+	def test_drops_repeated_ids_retweets_and_texts(self):
+		dedup = Deduplicator()
+		tweets = [make_tweet(1, u'so good #win'),
+		          make_tweet(1, u'so good #win'),
+		          make_tweet(2, u'RT @someone: so good #win', retweeted_status={'id': 1}),
+		          make_tweet(3, u'So  good #WIN'),
+		          make_tweet(4, u'@someone so good #win'),
+		          make_tweet(5, u'@someone_else so good #win')]
+		self.assertEqual([dedup.is_duplicate(tweet) for tweet in tweets],
+		                 [None, 'id', 'retweet', 'text', None, 'text'])
+
+	def test_retweet_before_original(self):
+		dedup = Deduplicator()
+		tweets = [make_tweet(2, u'RT @someone: so good #win', retweeted_status={'id': 1}),
+		          make_tweet(1, u'so very good #win'),
+		          make_tweet(3, u'RT @someone: so very good #win', retweeted_status={'id': 1}),
+		          make_tweet(1, u'so very good #win')]
+		self.assertEqual([dedup.is_duplicate(tweet) for tweet in tweets], [None, None, 'retweet', 'id'])
+
+	def test_retweets_without_ids(self):
+		dedup = Deduplicator()
+		tweets = [make_tweet(1, u'RT @a: one #win', retweeted_status={}),
+		          make_tweet(2, u'RT @a: two #win', retweeted_status={'text': u'two'}),
+		          make_tweet(3, u'RT @a: three #win', retweeted_status={'id': None})]
+		self.assertEqual([dedup.is_duplicate(tweet) for tweet in tweets], [None, None, None])
+
+	def test_non_ascii_texts_are_distinct(self):
+		dedup = Deduplicator()
+		tweets = [make_tweet(1, u'so good #win 😂'),
+		          make_tweet(2, u'so good #win 😍'),
+		          make_tweet(3, u'так хорошо #win'),
+		          make_tweet(4, u'так плохо #win'),
+		          make_tweet(5, u'so good #win 😍')]
+		self.assertEqual([dedup.is_duplicate(tweet) for tweet in tweets], [None, None, None, None, 'text'])
+
+	def test_to_json_keeps_the_original_text(self):
+		tweet = make_tweet(1, u'so good #win 😂')
+		text, metadata = json.loads(tweet.to_json())
+		self.assertEqual(ParsedTweet(text, metadata).get_raw_text(), u'so good #win 😂')
+
+
+if __name__ == '__main__':
+	unittest.main()
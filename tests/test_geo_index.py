@@ -0,0 +1,35 @@
+__author__ = 'samuelraker'
+
+import unittest
+from geo_index import GeoIndex
+
+
+class GeoIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.index = GeoIndex()
+		self.index.add(179.9, 0, 1, ['east'])
+		self.index.add(-179.9, 0, 2, ['west'])
+		self.index.add(0, 0, 3, ['middle'])
+		self.index.add(-74.0, 40.7, 4, ['nyc'])
+
+	def test_bbox(self):
+		self.assertEqual(self.index.bbox(-75, 40, -73, 41), [4])
+		self.assertEqual(sorted(self.index.bbox(-180, -90, 180, 90)), [1, 2, 3, 4])
+
+	def test_bbox_across_the_antimeridian(self):
+		self.assertEqual(sorted(self.index.bbox(179, -1, -179, 1)), [1, 2])
+		self.assertEqual(sorted(self.index.bbox(179, -1, 181, 1)), [1, 2])
+		self.assertEqual(self.index.bbox(179, -1, 180, 1), [1])
+		self.assertEqual(self.index.hashtags(179, -1, -179, 1), {'east': 1, 'west': 1})
+
+	def test_radius_across_the_antimeridian(self):
+		self.assertEqual(sorted(self.index.radius(179.9, 0, 100)), [1, 2])
+		self.assertEqual(sorted(self.index.radius(-179.95, 0.1, 50)), [1, 2])
+		self.assertEqual(self.index.radius(-74.0, 40.7, 10), [4])
+
+	def test_radius_with_everything_in_range(self):
+		self.assertEqual(sorted(self.index.radius(0, 89, 20000)), [1, 2, 3, 4])
+
+
+if __name__ == '__main__':
+	unittest.main()
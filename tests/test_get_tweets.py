@@ -0,0 +1,63 @@
+__author__ = 'samuelraker'
+
+import unittest
+from get_tweets import Twitterizer
+from instrument import METRICS
+from benchmarks.synthetic import generate
+
+
+class NextTweetTest(unittest.TestCase):
+	def setUp(self):
+		self.tweets = list(generate(4, seed=5, n_hashtags=20))
+		METRICS.reset()
+		METRICS.enable()
+
+	def tearDown(self):
+		METRICS.disable()
+		METRICS.reset()
+
+	def read(self, records, **kwargs):
+		t = Twitterizer(stream=object(), sample=iter(records))
+		return [t.next_tweet(t.sample, **kwargs) for _ in records]
+
+	def test_malformed_records(self):
+		raw = self.tweets[0]
+		records = [None, [raw], {'delete': {'status': {'id': 1}}}, {'limit': {'track': 3}},
+		           dict(raw, user=None), dict(raw, user={}), dict(raw, entities=None),
+		           dict(raw, entities={'hashtags': ['notadict']}), dict(raw, text=None)]
+		self.assertEqual(self.read(records), [None] * len(records))
+		self.assertEqual(METRICS.counters.get('filter.malformed'), len(records))
+
+	def test_well_formed_records(self):
+		tweets = self.read(self.tweets)
+		self.assertEqual([t.get_raw_text() for t in tweets], [raw['text'] for raw in self.tweets])
+		self.assertEqual(METRICS.counters.get('parse'), len(self.tweets))
+		self.assertEqual(METRICS.counters.get('filter.malformed'), None)
+
+	def test_filters(self):
+		raw = self.tweets[0]
+		no_lang = dict(raw)
+		del no_lang['lang']
+		no_tags = dict(raw, entities={'hashtags': []})
+		no_entities = dict(raw)
+		del no_entities['entities']
+		self.assertEqual(self.read([dict(raw, lang='fr'), no_lang, no_tags]), [None] * 3)
+		self.assertEqual(METRICS.counters.get('filter.dropped'), 3)
+		self.assertEqual(len(filter(None, self.read([no_lang], lang_none=True))), 1)
+		self.assertEqual(len(filter(None, self.read([no_tags, no_entities], hash_only=False))), 2)
+		self.assertEqual(self.read([raw], meta=False)[0].uid, None)
+
+	def test_tweet_iterator_limit(self):
+		sample = iter(self.tweets)
+		t = Twitterizer(stream=object(), sample=sample)
+		self.assertEqual(len(list(t.tweet_iterator(sample, limit=3))), 3)
+		self.assertEqual(len(list(t.tweet_iterator(sample, limit=3))), 1)
+
+	def test_bugs_propagate(self):
+		def broken(text):
+			raise KeyError('a bug in the tokenizer')
+		self.assertRaises(KeyError, self.read, self.tweets[:1], tokenize=broken)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,107 @@
+__author__ = 'samuelraker'
+
+import os
+import shutil
+import tempfile
+import unittest
+from hash_index import HashIndex
+
+
+class FakeTweet(object):
+	def __init__(self, tid, timestamp, hashtags):
+		self.metadata = {'id': tid, 'timestamp_ms': timestamp * 1000}
+		self.hashtags = hashtags
+
+	def get_hashes(self):
+		return self.hashtags
+
+
+class HashIndexTest(unittest.TestCase):
+	def setUp(self):
+		self.path = tempfile.mkdtemp(prefix='hash_out_test')
+		self.index = HashIndex(self.path)
+		for i in xrange(100):
+			tags = ['#Summer'] + (['win'] if i % 10 == 0 else []) + (['lose'] if i % 25 == 0 else [])
+			self.index.add_tweet(FakeTweet(1000 + i, 5000 + i, tags))
+
+	def tearDown(self):
+		shutil.rmtree(self.path)
+
+	def test_queries_before_and_after_saving(self):
+		for index in (self.index, self.save_and_reload()):
+			self.assertEqual(index.tweets('summer', 5010, 5012), [1010, 1011, 1012])
+			self.assertEqual(index.intersect('win', 'lose'), [1000, 1050])
+			self.assertEqual(index.cooccurring('win'), {'summer': 10, 'lose': 2})
+
+	def test_saves_append(self):
+		index = self.save_and_reload()
+		size = os.path.getsize(os.path.join(self.path, index.filename))
+		index.add_tweet(FakeTweet(2000, 9000, ['win']))
+		index.save()
+		index = HashIndex(self.path)
+		self.assertEqual(index.filename, 'postings.0.bin')
+		self.assertTrue(os.path.getsize(os.path.join(self.path, index.filename)) > size)
+		self.assertEqual(index.tweets('win', 8000), [2000])
+		self.assertEqual(len(index.tweets('win')), 11)
+
+	def test_interrupted_save_is_ignored(self):
+		index = self.save_and_reload()
+		with open(os.path.join(self.path, index.filename), 'ab') as f:
+			f.write('\x00' * 1000)
+		index = HashIndex(self.path)
+		self.assertEqual(len(index.tweets('summer')), 100)
+		index.add_tweet(FakeTweet(2000, 9000, ['summer']))
+		index.save()
+		index = HashIndex(self.path)
+		self.assertEqual(index.tweets('summer', 9000), [2000])
+		self.assertEqual(len(index.tweets('summer')), 101)
+
+	def test_out_of_order_postings(self):
+		index = self.save_and_reload()
+		index.add_tweet(FakeTweet(500, 1, ['summer', 'win']))
+		index.add_tweet(FakeTweet(1001, 7, ['summer']))
+		self.assertEqual(index.tweets('summer', 0, 10), [500, 1001])
+		index.save()
+		self.check_out_of_order(HashIndex(self.path))
+		self.check_out_of_order(self.compact_and_reload(index))
+
+	def check_out_of_order(self, index):
+		self.assertEqual(index.tweets('summer', 0, 10), [500, 1001])
+		self.assertEqual(len(index.tweets('summer')), 101)
+		self.assertEqual(index.cooccurring('win')['summer'], 11)
+
+	def test_compact(self):
+		index = self.save_and_reload()
+		index.add_tweet(FakeTweet(2000, 9000, ['win']))
+		index.save()
+		index = self.compact_and_reload(index)
+		self.assertEqual(os.listdir(self.path), ['postings.1.bin', 'tags.json'])
+		self.assertEqual(len(index.forward), 1)
+		self.assertEqual(len(index.tweets('win')), 11)
+		self.assertEqual(index.cooccurring('lose'), {'summer': 4, 'win': 2})
+
+	def test_save_needs_a_path(self):
+		index = HashIndex()
+		index.add_tweet(FakeTweet(1, 5000, ['win']))
+		self.assertRaises(ValueError, index.save)
+		self.assertRaises(ValueError, index.compact)
+		self.assertEqual(index.tweets('win'), [1])
+		index.save(self.path)
+		self.assertEqual(HashIndex(self.path).tweets('win'), [1])
+
+	def test_longitudinal_checks_index_path(self):
+		import get_tweets
+		self.assertRaises(ValueError, get_tweets.longitudinal, index=HashIndex(), stream=object())
+		self.assertRaises(ValueError, get_tweets.longitudinal_to_db, index=HashIndex(), stream=object())
+
+	def save_and_reload(self):
+		self.index.save()
+		return HashIndex(self.path)
+
+	def compact_and_reload(self, index):
+		index.compact()
+		return HashIndex(self.path)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,137 @@
+__author__ = 'samuelraker'
+
+import json
+import random
+import unittest
+from hash_stats import HashtagStats
+from hash_stats import SpaceSaving
+from hash_stats import CountMinSketch
+
+
+class FakeTweet(object):
+	def __init__(self, tid, timestamp, hashtags):
+		self.metadata = {'id': tid, 'timestamp_ms': timestamp * 1000}
+		self.hashtags = hashtags
+
+	def get_hashes(self):
+		return self.hashtags
+
+
+def make_stream(n, seed=0, tags=300, start=5000, per_second=10):
+	"""
+	:return: list of FakeTweets whose hashtags are drawn roughly Zipfian from tags distinct ones.
+	"""
+	rng = random.Random(seed)
+	stream = []
+	for i in xrange(n):
+		hashtags = ['tag{}'.format(min(tags, int(rng.paretovariate(1.1)))) for _ in xrange(rng.randint(1, 3))]
+		stream.append(FakeTweet(i, start + i // per_second, hashtags))
+	return stream
+
+
+def true_counts(stream):
+	counts = {}
+	for tweet in stream:
+		for tag in tweet.get_hashes():
+			counts[tag] = counts.get(tag, 0) + 1
+	return counts
+
+
+class HashtagStatsTest(unittest.TestCase):
+	def setUp(self):
+		self.stream = make_stream(2000)
+
+	def build(self, tweets, **kwargs):
+		stats = HashtagStats(window=60, **kwargs)
+		stats.add_tweets(tweets)
+		return stats
+
+	def test_merge_equals_whole_stream(self):
+		whole = self.build(self.stream, k=500)
+		half = len(self.stream) // 2
+		merged = self.build(self.stream[:half], k=500)
+		merged.merge(self.build(self.stream[half:], k=500))
+		self.assertEqual(merged.tweets, whole.tweets)
+		self.assertEqual(merged.frequencies.to_dict(), whole.frequencies.to_dict())
+		self.assertEqual(merged.distinct.to_dict(), whole.distinct.to_dict())
+		self.assertEqual(sorted(merged.windows), sorted(whole.windows))
+		for start in whole.windows:
+			self.assertEqual(merged.windows[start].to_dict(), whole.windows[start].to_dict())
+		self.assertEqual(sorted(merged.top(None)), sorted(whole.top(None)))
+		self.assertEqual(merged.distinct_count(), whole.distinct_count())
+
+	def test_json_round_trip(self):
+		stats = self.build(self.stream, k=20)
+		restored = HashtagStats.from_json(stats.to_json())
+		self.assertEqual(json.loads(restored.to_json()), json.loads(stats.to_json()))
+		self.assertEqual(restored.top(5), stats.top(5))
+		self.assertEqual(restored.count('tag1'), stats.count('tag1'))
+		self.assertEqual(restored.distinct_count(5000), stats.distinct_count(5000))
+		restored.merge(stats)
+		self.assertEqual(restored.tweets, 2 * stats.tweets)
+
+	def test_window_eviction(self):
+		stats = self.build(self.stream, max_windows=3)
+		starts = sorted(set(t.metadata['timestamp_ms'] // 1000 // 60 * 60 for t in self.stream))
+		self.assertTrue(len(starts) > 3)
+		self.assertEqual(sorted(stats.windows), starts[-3:])
+		self.assertEqual(stats.distinct_count(starts[0]), 0)
+		self.assertTrue(stats.distinct_count(starts[-1]) > 0)
+		stats.add_tweet(FakeTweet(-1, starts[0], ['late']))
+		self.assertEqual(sorted(stats.windows), starts[-3:])
+		other = self.build(make_stream(100, seed=1, start=starts[-1] + 60), max_windows=3)
+		stats.merge(other)
+		self.assertEqual(len(stats.windows), 3)
+		self.assertEqual(max(stats.windows), starts[-1] + 60)
+
+	def test_count_min_never_underestimates(self):
+		stats = self.build(self.stream, width=64)
+		counts = true_counts(self.stream)
+		total = sum(counts.values())
+		for tag, count in counts.items():
+			self.assertTrue(count <= stats.count(tag) <= count + total, tag)
+
+	def test_sketch_sizes_must_match(self):
+		self.assertRaises(ValueError, CountMinSketch(64).merge, CountMinSketch(128))
+
+
+class SpaceSavingTest(unittest.TestCase):
+	def check_bounds(self, summary, counts):
+		total = sum(counts.values())
+		self.assertEqual(summary.total, total)
+		for tag, count, error in summary.top():
+			self.assertTrue(count - error <= counts.get(tag, 0) <= count, (tag, count, error, counts.get(tag)))
+		tracked = set(tag for tag, _, _ in summary.top())
+		for tag, count in counts.items():
+			if count > total // summary.k:
+				self.assertIn(tag, tracked)
+
+	def summarize(self, stream, k):
+		summary = SpaceSaving(k)
+		for tweet in stream:
+			for tag in tweet.get_hashes():
+				summary.add(tag)
+		return summary
+
+	def test_error_bounds(self):
+		stream = make_stream(3000, seed=2)
+		summary = self.summarize(stream, 10)
+		self.assertEqual(len(summary.counts), 10)
+		self.check_bounds(summary, true_counts(stream))
+
+	def test_merged_error_bounds(self):
+		stream = make_stream(3000, seed=3)
+		summary = self.summarize(stream[:1000], 10)
+		summary.merge(self.summarize(stream[1000:], 10))
+		self.check_bounds(summary, true_counts(stream))
+
+	def test_exact_below_k(self):
+		stream = make_stream(200, seed=4, tags=5)
+		summary = self.summarize(stream, 10)
+		counts = true_counts(stream)
+		self.assertEqual(dict((tag, count) for tag, count, _ in summary.top()), counts)
+		self.assertTrue(all(error == 0 for _, _, error in summary.top()))
+
+
+if __name__ == '__main__':
+	unittest.main()
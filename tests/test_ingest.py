@@ -0,0 +1,101 @@
+__author__ = 'samuelraker'
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import ingest
+from tests import db
+from benchmarks.synthetic import generate, write_jsonl
+
+
+class IngestTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.get_tweets = db.setup_django()
+		cls.workdir = tempfile.mkdtemp(prefix='hash_out_test')
+		cls.infile = os.path.join(cls.workdir, 'tweets.json')
+		write_jsonl(cls.infile, 60, n_hashtags=40)
+		with open(cls.infile) as f:
+			cls.n_tags = sum(len(json.loads(line)[1]['entities']['hashtags']) for line in f)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.workdir)
+
+	def setUp(self):
+		db.clear_tables()
+
+	def check_tables(self, tweets, hashtags):
+		from django.db.models import F
+		get_tweets = self.get_tweets
+		self.assertEqual(db.pks(get_tweets.Tweet), range(1, tweets + 1))
+		self.assertEqual(db.pks(get_tweets.Hashtag), range(1, hashtags + 1))
+		self.assertEqual(get_tweets.Hashtag.tweet.through.objects.count(), hashtags)
+		pairs = hashtags * (hashtags - 1) // 2
+		self.assertEqual(db.pks(get_tweets.Competitors), range(1, pairs + 1))
+		self.assertEqual(len(set(get_tweets.Competitors.objects.values_list('tag1_id', 'tag2_id'))), pairs)
+		self.assertFalse(get_tweets.Competitors.objects.filter(tag1__id__gte=F('tag2__id')).exists())
+
+	def test_sharded_json_to_db(self):
+		ingest.sharded_json_to_db(self.infile, workers=3, batch_size=7, dedup=False, verbosity=False)
+		self.check_tables(60, self.n_tags)
+
+	def test_second_load_carries_on(self):
+		ingest.sharded_json_to_db(self.infile, workers=2, batch_size=7, dedup=False, verbosity=False)
+		ingest.sharded_json_to_db(self.infile, workers=3, batch_size=5, dedup=False, verbosity=False)
+		self.check_tables(120, self.n_tags * 2)
+
+	def test_dedup(self):
+		infile = os.path.join(self.workdir, 'twice.json')
+		with open(self.infile) as f:
+			lines = f.read()
+		with open(infile, 'w') as f:
+			f.write(lines + lines)
+		ingest.sharded_json_to_db(infile, workers=1, batch_size=7, verbosity=False)
+		self.check_tables(60, self.n_tags)
+
+	def test_read_shard_accepts_raw_lines(self):
+		infile = os.path.join(self.workdir, 'mixed.json')
+		raw = list(generate(3, seed=2))
+		with open(infile, 'w') as f:
+			f.write(json.dumps(raw[0]) + '\n')
+			f.write('not json\n')
+			f.write(json.dumps({'text': 'x', 'user': None}) + '\n')
+			f.write(json.dumps([raw[1]['text'], raw[1]]) + '\n')
+		tweets = list(ingest.read_shard(infile, 0, os.path.getsize(infile)))
+		self.assertEqual([tweet.get_raw_text() for tweet in tweets], [raw[0]['text'], raw[1]['text']])
+
+	def test_sharded_stream_to_db(self):
+		sample = iter(list(generate(30, seed=1, n_hashtags=20)))
+		ingest.sharded_stream_to_db(sample, limit=25, workers=2, batch_size=4, dedup=False, verbosity=False)
+		self.check_tables(25, self.get_tweets.Hashtag.objects.count())
+
+	def test_stream_skips_malformed_records(self):
+		tweets = list(generate(20, seed=1, n_hashtags=20))
+		sample = []
+		for i, raw in enumerate(tweets):
+			sample.append(raw)
+			sample.append([None, {'delete': {'status': {'id': i}}}, dict(raw, user=None)][i % 3])
+		ingest.sharded_stream_to_db(iter(sample), limit=40, workers=2, batch_size=4, dedup=False, verbosity=False)
+		self.check_tables(20, self.get_tweets.Hashtag.objects.count())
+
+	def test_no_checkpoint_with_workers(self):
+		checkpoint = os.path.join(self.workdir, 'load.ckpt')
+		self.assertRaises(ValueError, self.get_tweets.json_to_db, self.infile, workers=2, checkpoint=checkpoint)
+		self.assertEqual(self.get_tweets.Tweet.objects.count(), 0)
+
+	def test_dead_worker(self):
+		ingest_method = ingest.Worker.ingest
+		ingest.Worker.ingest = lambda worker, tweets: os._exit(3)
+		try:
+			with self.assertRaises(RuntimeError) as raised:
+				ingest.sharded_json_to_db(self.infile, workers=2, verbosity=False)
+		finally:
+			ingest.Worker.ingest = ingest_method
+		self.assertIn('exited with code 3 without reporting', str(raised.exception))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,158 @@
+__author__ = 'samuelraker'
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests import db
+from pair_cache import BloomFilter
+from pair_cache import PairCache
+from benchmarks.synthetic import write_jsonl
+
+
+class BloomFilterTest(unittest.TestCase):
+	def test_no_false_negatives(self):
+		bloom = BloomFilter(1 << 14)
+		for i in xrange(500):
+			bloom.add((i, i + 1))
+		self.assertTrue(all((i, i + 1) in bloom for i in xrange(500)))
+		false = sum((i, i + 2) in bloom for i in xrange(2000))
+		self.assertTrue(false < 40, false)
+
+
+class PairCacheTest(unittest.TestCase):
+	def test_either_order(self):
+		cache = PairCache()
+		cache.warm([(1, 2)])
+		self.assertTrue(cache.exists(2, 1))
+		self.assertFalse(cache.exists(1, 3))
+
+	def test_complete_until_evicted(self):
+		lookups = []
+		cache = PairCache(max_size=4)
+		cache.warm([(1, 2), (1, 3)])
+		self.assertFalse(cache.exists(2, 3, lambda a, b: lookups.append((a, b))))
+		self.assertEqual(lookups, [])
+		for b in xrange(4, 10):
+			cache.add(1, b)
+		self.assertFalse(cache.complete)
+		self.assertTrue(len(cache) <= 4)
+
+	def test_bloom_filter_rules_out_after_eviction(self):
+		lookups = []
+
+		def lookup(a, b):
+			lookups.append((a, b))
+			return True
+
+		cache = PairCache(max_size=4, bloom_bits=1 << 14)
+		cache.warm((1, b) for b in xrange(2, 50))
+		self.assertFalse(cache.complete)
+		for b in xrange(2, 50):
+			cache.exists(2, b, lookup)
+		self.assertTrue(len(lookups) < 5, lookups)
+		self.assertTrue(cache.exists(1, 2, lookup))
+		self.assertTrue((1, 2) in lookups)
+		self.assertTrue(cache.exists(2, 1))
+
+	def test_hit_keeps_pair(self):
+		cache = PairCache(max_size=4)
+		cache.warm([(1, 2)])
+		for b in xrange(3, 20):
+			self.assertTrue(cache.exists(1, 2))
+			cache.add(1, b)
+		self.assertTrue(cache.exists(1, 2))
+		self.assertEqual(cache.lookups, 0)
+
+
+class PairQueryTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.get_tweets = db.setup_django()
+
+	def setUp(self):
+		db.clear_tables()
+		self.workdir = tempfile.mkdtemp(prefix='hash_out_test')
+		self.infile = os.path.join(self.workdir, 'tweets.json')
+		write_jsonl(self.infile, 20, n_hashtags=15)
+
+	def tearDown(self):
+		shutil.rmtree(self.workdir)
+
+	def twitterator(self):
+		ator = self.get_tweets.Twitterator(self.infile, verbosity=False)
+		ator.warm_pair_cache(max_size=8, bloom_bits=1 << 16)
+		queries = []
+		pair_exists = ator.pair_exists
+
+		def counting(a, b):
+			queries.append((a, b))
+			return pair_exists(a, b)
+		ator.pair_exists = counting
+		return ator, queries
+
+	def test_pair_exists_is_one_query(self):
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+		get_tweets = self.get_tweets
+		ator, _ = self.twitterator()
+		ator.tweets_to_db()
+		tag1, tag2 = get_tweets.Hashtag.objects.order_by('pk')[:2]
+		get_tweets.Competitors.objects.create(id=1, tag1=tag2, tag2=tag1, yes=0, no=0)
+		with CaptureQueriesContext(connection) as captured:
+			self.assertTrue(ator.pair_exists(tag1.pk, tag2.pk))
+			self.assertFalse(ator.pair_exists(tag1.pk, tag1.pk))
+		self.assertEqual(len(captured), 2)
+
+	def test_few_queries_after_eviction(self):
+		get_tweets = self.get_tweets
+		ator, queries = self.twitterator()
+		ator.tweets_to_db()
+		ator.competitors_to_db()
+		n = get_tweets.Hashtag.objects.count()
+		pairs = n * (n - 1) // 2
+		self.assertEqual(get_tweets.Competitors.objects.count(), pairs)
+		self.assertFalse(ator.pair_cache.complete)
+		self.assertTrue(len(queries) < pairs // 20, (len(queries), pairs))
+		again, queries = self.twitterator()
+		again.competitors_to_db()
+		self.assertEqual(get_tweets.Competitors.objects.count(), pairs)
+		self.assertEqual(len(set(get_tweets.Competitors.objects.values_list('tag1_id', 'tag2_id'))), pairs)
+
+
+	def test_add_new_competitor(self):
+		get_tweets = self.get_tweets
+		ator, queries = self.twitterator()
+		with open(self.infile) as f:
+			tweets = [get_tweets.parse_line(line) for line in f][:5]
+		for tweet in tweets:
+			ator.add_new_competitor(tweet)
+		n = get_tweets.Hashtag.objects.count()
+		self.assertEqual(n, sum(len(tweet.get_hashes()) for tweet in tweets))
+		pairs = set(get_tweets.Competitors.objects.values_list('tag1_id', 'tag2_id'))
+		self.assertEqual(get_tweets.Competitors.objects.count(), n * (n - 1) // 2)
+		self.assertEqual(len(set(PairCache.key(a, b) for a, b in pairs)), n * (n - 1) // 2)
+		self.assertFalse(any(a == b for a, b in pairs))
+		self.assertTrue(ator.pair_cache.warmed)
+		self.assertTrue(ator.pair_cache.hits > 0)
+
+	def test_many_existing_rows(self):
+		get_tweets = self.get_tweets
+		Tweet, Hashtag, Competitors = get_tweets.Tweet, get_tweets.Hashtag, get_tweets.Competitors
+		Tweet.objects.bulk_create([Tweet(id=i, text='', munged_text='') for i in xrange(1, 1101)])
+		Hashtag.objects.bulk_create([Hashtag(id=i, text='tag{}'.format(i)) for i in xrange(1, 52)])
+		Competitors.objects.bulk_create([Competitors(id=pk, tag1_id=a, tag2_id=b, yes=0, no=0) for pk, (a, b)
+		                                 in enumerate(((a, b) for b in xrange(2, 51) for a in xrange(1, b)), 1)])
+		self.assertEqual(Competitors.objects.count(), 1225)
+		get_tweets.Twitterator(verbosity=False).competitors_to_db()
+		self.assertEqual(db.pks(Competitors), range(1, 1276))
+		with open(self.infile) as f:
+			tweet = get_tweets.parse_line(f.readline())
+		get_tweets.Twitterator(verbosity=False).add_new_competitor(tweet)
+		self.assertEqual(db.pks(Tweet), range(1, 1102))
+		n = Hashtag.objects.count()
+		self.assertEqual(n, 51 + len(tweet.get_hashes()))
+		self.assertEqual(db.pks(Competitors), range(1, n * (n - 1) // 2 + 1))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,75 @@
+__author__ = 'samuelraker'
+
+import os
+import json
+import signal
+import shutil
+import tempfile
+import unittest
+import replay
+from benchmarks.synthetic import generate
+
+
+class ReplayTest(unittest.TestCase):
+	def setUp(self):
+		self.workdir = tempfile.mkdtemp(prefix='hash_out_test')
+		#a replay that never stops should fail the test rather than hang it.
+		signal.signal(signal.SIGALRM, self.timeout)
+		signal.alarm(30)
+
+	def tearDown(self):
+		signal.alarm(0)
+		shutil.rmtree(self.workdir)
+
+	def timeout(self, *args):
+		raise AssertionError("replay didn't stop")
+
+	def capture(self, name, lines):
+		path = os.path.join(self.workdir, name)
+		with open(path, 'w') as f:
+			for line in lines:
+				f.write(line + '\n')
+		return path
+
+	def tweets(self, n):
+		return [json.dumps(raw) for raw in generate(n, seed=3, n_hashtags=20)]
+
+	def drain(self, source, most=1000):
+		records = []
+		for _ in xrange(most):
+			try:
+				records.append(source.next())
+			except StopIteration:
+				break
+		return records
+
+	def test_loop(self):
+		path = self.capture('tweets.json', self.tweets(3) + ['not json'])
+		self.assertEqual(len(self.drain(replay.ReplaySource(path))), 3)
+		self.assertEqual(len(self.drain(replay.ReplaySource(path, loop=True), 10)), 10)
+		self.assertEqual(len(self.drain(replay.ReplaySource(path, loop=True, preload=True), 10)), 10)
+
+	def test_loop_stops_on_empty_capture(self):
+		for lines in ([], ['', 'not json', '{"text": ']):
+			path = self.capture('empty.json', lines)
+			for preload in (False, True):
+				self.assertEqual(self.drain(replay.ReplaySource(path, loop=True, preload=preload)), [])
+
+	def test_measure(self):
+		path = self.capture('tweets.json', self.tweets(5))
+		report = replay.measure(path, limit=12, disconnect_every=4)
+		self.assertEqual(report['parsed'], 12)
+		self.assertTrue(report['disconnects'] >= 2)
+		self.assertEqual(replay.measure(path, limit=12, disconnect_every=5)['parsed'], 12)
+
+	def test_measure_stops_when_nothing_parses(self):
+		path = self.capture('tweets.json', self.tweets(5))
+		self.assertEqual(replay.measure(path, limit=10, lang='xx')['parsed'], 0)
+		self.assertEqual(replay.measure(path, limit=10, disconnect_every=2, lang='xx')['parsed'], 0)
+		self.assertEqual(replay.measure(path, limit=10, malformed=1.0)['parsed'], 0)
+		empty = self.capture('empty.json', [])
+		self.assertEqual(replay.measure(empty, limit=10, disconnect_every=2)['parsed'], 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,135 @@
+__author__ = 'samuelraker'
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from tests import db
+from checkpoint import Checkpoint
+from benchmarks.synthetic import generate, write_jsonl
+
+
+class Crash(Exception):
+	pass
+
+
+class ResumeTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.get_tweets = db.setup_django()
+
+	def setUp(self):
+		db.clear_tables()
+		self.workdir = tempfile.mkdtemp(prefix='hash_out_test')
+		self.infile = os.path.join(self.workdir, 'tweets.json')
+		write_jsonl(self.infile, 25, n_hashtags=15)
+		with open(self.infile) as f:
+			self.uids = sorted(json.loads(line)[1]['user']['id'] for line in f)
+		self.checkpoint = Checkpoint(os.path.join(self.workdir, 'load.ckpt'))
+		self.job = 'tweets_to_db:{}'.format(os.path.abspath(self.infile))
+
+	def tearDown(self):
+		shutil.rmtree(self.workdir)
+
+	def twitterator(self):
+		return self.get_tweets.Twitterator(self.infile, verbosity=False)
+
+	def saved_uids(self):
+		return sorted(self.get_tweets.Tweet.objects.values_list('uid', flat=True))
+
+	def crash_after(self, ator, method, n):
+		"""
+		Makes ator's method raise Crash on its nth call.
+		"""
+		original = getattr(ator, method)
+		calls = []
+
+		def crashing(*args, **kwargs):
+			calls.append(args)
+			if len(calls) == n:
+				raise Crash()
+			return original(*args, **kwargs)
+		setattr(ator, method, crashing)
+
+	def test_load_in_batches(self):
+		self.twitterator().tweets_to_db(checkpoint=self.checkpoint, batch_size=10)
+		self.assertEqual(self.saved_uids(), self.uids)
+		self.assertEqual(db.pks(self.get_tweets.Tweet), range(1, 26))
+		self.assertEqual(self.checkpoint.get(self.job), {'offset': os.path.getsize(self.infile)})
+
+	def test_crash_mid_batch(self):
+		ator = self.twitterator()
+		self.crash_after(ator, 'tweet_to_db', 15)
+		self.assertRaises(Crash, ator.tweets_to_db, checkpoint=self.checkpoint, batch_size=10)
+		self.assertEqual(self.get_tweets.Tweet.objects.count(), 10)
+		self.assertEqual(self.checkpoint.get(self.job)['pending']['tweet_i'], 11)
+		self.twitterator().tweets_to_db(checkpoint=Checkpoint(self.checkpoint.path), batch_size=10)
+		self.assertEqual(self.saved_uids(), self.uids)
+
+	def test_crash_after_commit(self):
+		ator = self.twitterator()
+		update = self.checkpoint.update
+
+		def crashing(job, **state):
+			if 'offset' in state and state['offset'] > 0 and self.get_tweets.Tweet.objects.count() == 20:
+				raise Crash()
+			return update(job, **state)
+		self.checkpoint.update = crashing
+		self.assertRaises(Crash, ator.tweets_to_db, checkpoint=self.checkpoint, batch_size=10)
+		self.assertEqual(self.get_tweets.Tweet.objects.count(), 20)
+		checkpoint = Checkpoint(self.checkpoint.path)
+		self.assertEqual(checkpoint.get(self.job)['pending']['tweet_i'], 11)
+		self.twitterator().tweets_to_db(checkpoint=checkpoint, batch_size=10)
+		self.assertEqual(self.saved_uids(), self.uids)
+		self.assertEqual(db.pks(self.get_tweets.Tweet), range(1, 26))
+
+	def test_raw_tweet_lines(self):
+		with open(self.infile, 'a') as f:
+			for tweet in generate(3, seed=5):
+				f.write(json.dumps(tweet) + '\n')
+			f.write(json.dumps({'delete': {'status': {'id': 1}}}) + '\n')
+			f.write('not json\n')
+		self.twitterator().tweets_to_db(checkpoint=self.checkpoint, batch_size=10)
+		self.assertEqual(self.get_tweets.Tweet.objects.count(), 28)
+
+	def test_retry_inside_a_transaction(self):
+		get_tweets = self.get_tweets
+		ator = self.twitterator()
+		first, second = [get_tweets.ParsedTweet(tweet['text'], tweet) for tweet in generate(2, seed=3)]
+		ator.tweet_to_db(first)
+		ator.tweet_i = 1
+		ator.hash_i = 1
+		with get_tweets.atomic():
+			ator.tweet_to_db(second)
+		self.assertEqual(db.pks(get_tweets.Tweet), [1, 2])
+		self.assertEqual(get_tweets.Hashtag.objects.count(),
+		                 len(first.get_hashes()) + len(second.get_hashes()))
+
+	def test_other_integrity_errors_propagate(self):
+		get_tweets = self.get_tweets
+		ator = self.twitterator()
+		ator.make_tweet = lambda tweet, pk: get_tweets.Tweet(id=pk, text=None)
+		tweet = get_tweets.ParsedTweet(u'so good #win', {'user': {'id': 1}})
+		self.assertRaises(get_tweets.IntegrityError, ator.tweet_to_db, tweet)
+		self.assertEqual(get_tweets.Tweet.objects.count(), 0)
+
+	def test_resume_competitors(self):
+		get_tweets = self.get_tweets
+		self.twitterator().tweets_to_db()
+		n = get_tweets.Hashtag.objects.count()
+		ator = self.twitterator()
+		self.crash_after(ator, '__save_comps__', 100)
+		self.assertRaises(Crash, ator.competitors_to_db, checkpoint=self.checkpoint, batch_size=30)
+		state = self.checkpoint.get('competitors_to_db')
+		self.assertEqual(get_tweets.Competitors.objects.count(), 99)
+		self.assertTrue(state['i'] > 1)
+		self.twitterator().competitors_to_db(checkpoint=Checkpoint(self.checkpoint.path), batch_size=30)
+		pairs = set(get_tweets.Competitors.objects.values_list('tag1_id', 'tag2_id'))
+		self.assertEqual(len(pairs), n * (n - 1) // 2)
+		self.assertEqual(get_tweets.Competitors.objects.count(), len(pairs))
+		self.assertEqual(Checkpoint(self.checkpoint.path).get('competitors_to_db'), {})
+
+
+if __name__ == '__main__':
+	unittest.main()
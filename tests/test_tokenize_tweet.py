@@ -0,0 +1,43 @@
+__author__ = 'samuelraker'
+
+import os
+import sys
+import unittest
+import tokenize_tweet
+from get_tweets import ParsedTweet
+
+
+class HashtagTokenizerTest(unittest.TestCase):
+	def test_camel_case(self):
+		self.assertEqual(tokenize_tweet.hashtag(u'go #GoTeamUSA'), [u'go', u'go', u'team', u'usa'])
+
+	def test_lowercase_tag_in_any_directory(self):
+		cwd = os.getcwd()
+		here = os.path.dirname(os.path.abspath(__file__))
+		#'' on sys.path means the current directory, so keep the modules importable from here.
+		sys.path.insert(0, os.path.dirname(here))
+		os.chdir(here)
+		try:
+			tweet = ParsedTweet(u'go #summer', {'user': {'id': 1}}, tokenize='hashtag')
+		finally:
+			os.chdir(cwd)
+			sys.path.pop(0)
+		self.assertEqual(tweet.get_tokenized()[0], u'go')
+		self.assertEqual(''.join(tweet.get_tokenized()[1:]), u'summer')
+
+
+
+class GetTokenizedTest(unittest.TestCase):
+	def test_non_ascii_text(self):
+		for tokenize in (None, 'whitespace', 'tweet'):
+			tweet = ParsedTweet(u'h\xe9llo #x', {'user': {'id': 1}}, tokenize)
+			self.assertEqual(tweet.get_tokenized()[-1], u'#x')
+			self.assertTrue(all(isinstance(word, unicode) for word in tweet.get_tokenized()))
+
+	def test_byte_string_tokens_are_decoded(self):
+		tweet = ParsedTweet(u'h\xe9llo #x', {'user': {'id': 1}}, lambda text: text.encode('utf8').split())
+		self.assertEqual(tweet.get_tokenized(), [u'h\ufffd\ufffdllo', u'#x'])
+		self.assertEqual(tweet.get_tokenized(decode=False), ['h\xef\xbf\xbd\xef\xbf\xbdllo', '#x'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,5 +1,6 @@
 __author__ = 'samuelraker'
 
+import os
 import re
 from math import log
 
@@ -20,7 +21,9 @@ def get_words(infile="words.txt"):
 
 ##taken from http://stackoverflow.com/questions/8870261/how-to-split-text-without-spaces-into-list-of-words
 # Build a cost dictionary, assuming Zipf's law and cost = -math.log(probability).
-words = open("words-by-frequency.txt").read().split()
+# The word list is looked for next to this file, not in the current directory.
+WORDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "words-by-frequency.txt")
+words = open(WORDS).read().split()
 wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
 maxword = max(len(x) for x in words)
 
@@ -0,0 +1,157 @@
+__author__ = 'samuelraker'
+
+import re
+from instrument import log
+
+
+###Precompiled tokenizers for ParsedTweet, looked up by name.
+###Each tokenizer is a function that takes a string and returns a list of tokens.
+
+
+whitespace_p = re.compile(r'\s+')
+tweet_p = re.compile(r'https?://\S+|www\.\S+|[#@][\w_]+|\w+(?:[\'-]\w+)*|[^\w\s]+', re.UNICODE)
+camel_p = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+TOKENIZERS = {}
+
+_infer_spaces = None
+_INFER_SPACES_CHECKED = False
+
+
+def register_tokenizer(name, cache_size=10000):
+	"""
+	A decorator that adds a tokenizer to TOKENIZERS under the given name, caching its output.
+	:param name: the name to register the tokenizer under.
+	:type name: string.
+	:param cache_size: how many texts' tokens to cache. If 0, nothing is cached.
+	:type cache_size: integer.
+	"""
+	def register(func):
+		tokenizer = cached(func, cache_size) if cache_size else func
+		TOKENIZERS[name] = tokenizer
+		return tokenizer
+	return register
+
+
+def cached(func, size=10000):
+	"""
+	Wraps a tokenizer so that the tokens of recently seen texts are returned without re-tokenizing.
+	The cache is emptied whenever it fills up, so it never holds more than size texts.
+	NB: the same list is returned for repeated texts, so don't modify it in place.
+	:param func: the tokenizer.
+	:type func: function.
+	:param size: the maximum number of texts to cache.
+	:type size: integer.
+	:return: function.
+	"""
+	cache = {}
+
+	def tokenize(s):
+		try:
+			return cache[s]
+		except KeyError:
+			if len(cache) >= size:
+				cache.clear()
+			tokens = cache[s] = func(s)
+			return tokens
+	tokenize.cache = cache
+	tokenize.__name__ = func.__name__
+	tokenize.__doc__ = func.__doc__
+	return tokenize
+
+
+def get_tokenizer(tokenizer):
+	"""
+	:param tokenizer: the name of a registered tokenizer, or a tokenization function (which is
+	returned as-is.)
+	:type tokenizer: string or function.
+	:return: function.
+	"""
+	if callable(tokenizer):
+		return tokenizer
+	try:
+		return TOKENIZERS[tokenizer]
+	except KeyError:
+		raise ValueError("No tokenizer registered as {}. Choose from: {}".format(
+			tokenizer, ", ".join(sorted(TOKENIZERS))))
+
+
+def tokenize_batch(texts, tokenizer='whitespace'):
+	"""
+	Tokenizes a list of texts with the same tokenizer.
+	:param texts: the texts to tokenize.
+	:type texts: list of strings.
+	:param tokenizer: the name of a registered tokenizer, or a tokenization function.
+	:type tokenizer: string or function.
+	:return: list of lists of strings.
+	"""
+	return map(get_tokenizer(tokenizer), texts)
+
+
+@register_tokenizer('whitespace')
+def whitespace(s):
+	"""
+	Splits a string by whitespace. This is ParsedTweet's default tokenizer.
+	"""
+	return whitespace_p.split(s)
+
+
+@register_tokenizer('tweet')
+def tweet(s):
+	"""
+	Splits a string into words and punctuation, keeping URLs, #hashtags and @usernames whole.
+	"""
+	return tweet_p.findall(s)
+
+
+def load_infer_spaces():
+	"""
+	Imports tokenize_hash.infer_spaces the first time it's needed. tokenize_hash reads its word list
+	(words-by-frequency.txt, next to tokenize_hash.py) when it's imported; if the list is missing, a
+	warning is logged, once, and hashtags that aren't camelCased are left whole.
+	:return: function, or None if the word list is missing.
+	"""
+	global _infer_spaces, _INFER_SPACES_CHECKED
+	if not _INFER_SPACES_CHECKED:
+		_INFER_SPACES_CHECKED = True
+		try:
+			from tokenize_hash import infer_spaces
+			_infer_spaces = infer_spaces
+		except IOError as e:
+			log.warning("can't segment lowercase hashtags: tokenize_hash couldn't read its word list (%s)", e)
+	return _infer_spaces
+
+
+@cached
+def segment_hashtag(tag):
+	"""
+	Splits a hashtag into words: by case if it's camelCased (e.g. #GoTeamUSA), otherwise via
+	tokenize_hash.infer_spaces (e.g. #goteamusa), if its word list is available (see
+	load_infer_spaces, above.)
+	:param tag: the hashtag, with or without the leading '#'.
+	:type tag: string.
+	:return: list of strings.
+	"""
+	tag = tag.lstrip('#')
+	words = camel_p.findall(tag)
+	if len(words) > 1:
+		return [word.lower() for word in words]
+	infer_spaces = load_infer_spaces()
+	if infer_spaces is None:
+		return [tag.lower()]
+	return infer_spaces(tag.lower()).split()
+
+
+@register_tokenizer('hashtag')
+def hashtag(s):
+	"""
+	Like the 'tweet' tokenizer, but each hashtag is replaced by the words it's made of
+	(see segment_hashtag, above.)
+	"""
+	tokens = []
+	for token in tweet_p.findall(s):
+		if token.startswith('#') and len(token) > 1:
+			tokens += segment_hashtag(token)
+		else:
+			tokens.append(token)
+	return tokens